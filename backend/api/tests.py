@@ -0,0 +1,519 @@
+import importlib
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.v1.async_views import TagListView
+from api.v1.filters import IngredientFilter
+from core import constants
+from core.tests import TemporaryMetricsDirMixin
+from recipes.models import (
+    FavoriteRecipes,
+    FeedEntry,
+    Ingredient,
+    IngredientQuantity,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+
+User = get_user_model()
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api-tests',
+    },
+    'recipes': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api-tests-recipes',
+    },
+}
+
+
+def create_user(number):
+    return User.objects.create_user(
+        username=f'user{number}',
+        email=f'user{number}@example.com',
+        first_name='Имя',
+        last_name='Фамилия',
+        password='test-password',
+    )
+
+
+def create_recipe(author, name, tags, ingredients):
+    recipe = Recipe.objects.create(
+        author=author,
+        name=name,
+        text='Описание',
+        cooking_time=10,
+        image='api/imgs/test.png',
+    )
+    recipe.tags.set(tags)
+    IngredientQuantity.objects.bulk_create(
+        [
+            IngredientQuantity(recipe=recipe, ingredient=ing, amount=10)
+            for ing in ingredients
+        ]
+    )
+    return recipe
+
+
+@override_settings(CACHES=TEST_CACHES, IMAGE_PROCESSING_WORKERS=0)
+class APITestCase(TemporaryMetricsDirMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        cls.authors = [create_user(number) for number in range(1, 4)]
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', color=f'#00000{i}', slug=f't{i}'
+            )
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(4)
+        ]
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Recipe list runs the same number of queries for any page size."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(8):
+            recipe = create_recipe(
+                cls.authors[i % 3],
+                f'Рецепт {i}',
+                cls.tags[: i % 3 + 1],
+                cls.ingredients[: i % 4 + 1],
+            )
+            if i % 2:
+                FavoriteRecipes.objects.create(user=cls.user, recipe=recipe)
+        cls.user.following.add(cls.authors[0])
+
+    def get_page(self, limit, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(f'/api/recipes/?limit={limit}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+
+    def test_cache_miss(self):
+        """Tag map, count, page, authors, tags and ingredients."""
+
+        for limit in [2, 6]:
+            with self.subTest(limit=limit):
+                for cache in caches.all():
+                    cache.clear()
+                self.get_page(limit, 6)
+
+    def test_cache_hit(self):
+        """Count and page only."""
+
+        self.client.get('/api/recipes/?limit=6')
+        for limit in [2, 6]:
+            with self.subTest(limit=limit):
+                self.get_page(limit, 2)
+
+
+class KeysetPaginationTest(APITestCase):
+    """Cursor pages walk recipes by (created_at, id) in both directions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        recipes = [
+            create_recipe(
+                cls.authors[0], f'Рецепт {i}', cls.tags[:1], cls.ingredients
+            )
+            for i in range(7)
+        ]
+        now = timezone.now()
+        for i, recipe in enumerate(recipes):
+            Recipe.objects.filter(id=recipe.id).update(
+                created_at=now - timedelta(minutes=i // 3)
+            )
+        cls.ordered_ids = list(
+            Recipe.objects.order_by('-created_at', '-id').values_list(
+                'id', flat=True
+            )
+        )
+
+    def walk(self, url, link):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page_ids = [recipe['id'] for recipe in response.data['results']]
+            ids.append(page_ids)
+            self.assertNotIn('count', response.data)
+            last_url, url = url, response.data[link]
+        return ids, last_url
+
+    def test_forward_and_backward(self):
+        forward, last_url = self.walk('/api/recipes/?limit=3&cursor=', 'next')
+        self.assertEqual(sum(forward, []), self.ordered_ids)
+        self.assertEqual([len(page) for page in forward], [3, 3, 1])
+        previous = self.client.get(last_url).data['previous']
+        backward, _ = self.walk(previous, 'previous')
+        self.assertEqual(backward, forward[-2::-1])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/?cursor=broken')
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeDataCacheTest(APITestCase):
+    """Cached recipe data is checked against recipe updated_at."""
+
+    def test_stale_entry_is_ignored(self):
+        recipe = create_recipe(
+            self.authors[0], 'Рецепт', self.tags[:1], self.ingredients[:1]
+        )
+        url = f'/api/recipes/{recipe.id}/'
+        self.assertEqual(self.client.get(url).data['name'], 'Рецепт')
+        Recipe.objects.filter(id=recipe.id).update(
+            name='Новый рецепт', updated_at=timezone.now()
+        )
+        self.assertEqual(self.client.get(url).data['name'], 'Новый рецепт')
+
+
+class CountersTest(APITestCase):
+    """Counters don't go below zero when they drifted from rows."""
+
+    def test_favorites_count_is_not_negative(self):
+        recipe = create_recipe(
+            self.authors[0], 'Рецепт', self.tags[:1], self.ingredients[:1]
+        )
+        FavoriteRecipes.objects.create(user=self.user, recipe=recipe)
+        response = self.client.delete(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 204)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+
+    def test_followers_count_is_not_negative(self):
+        self.user.following.add(self.authors[0])
+        response = self.client.delete(
+            f'/api/users/{self.authors[0].id}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.authors[0].refresh_from_db()
+        self.assertEqual(self.authors[0].followers_count, 0)
+
+
+class SaveRelationTest(APITestCase):
+    """Only a duplicate insert is reported as duplicate."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = create_recipe(
+            self.authors[0], 'Рецепт', self.tags[:1], self.ingredients[:1]
+        )
+
+    def test_duplicate(self):
+        url = f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data, {'errors': 'Рецепт уже в корзине покупок!'}
+        )
+
+    def test_shopping_list_error_is_not_duplicate(self):
+        url = f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        with mock.patch.object(
+            ShoppingListItem.objects,
+            'add_recipe',
+            side_effect=IntegrityError('shopping list'),
+        ):
+            with self.assertRaisesMessage(IntegrityError, 'shopping list'):
+                self.client.post(url)
+        self.assertFalse(ShoppingCart.objects.exists())
+
+
+@mock.patch.object(constants, 'FEED_FANOUT_MAX_FOLLOWERS', 1)
+class FeedTest(APITestCase):
+    """Feed merges fan-out timeline with recipes of pulled authors."""
+
+    def subscribe(self, user, author, method='post'):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = getattr(client, method)(
+            f'/api/users/{author.id}/subscribe/'
+        )
+        self.assertIn(response.status_code, [201, 204])
+
+    def create_recipes(self):
+        for i in range(6):
+            create_recipe(
+                self.authors[i % 2], f'Рецепт {i}', self.tags[:1], []
+            )
+
+    def get_feed_ids(self):
+        ids = []
+        url = '/api/recipes/feed/?limit=4'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def expected_ids(self):
+        return list(
+            Recipe.objects.filter(author__in=self.authors[:2])
+            .order_by('-created_at', '-id')
+            .values_list('id', flat=True)
+        )
+
+    def test_merge_of_timeline_and_pulled_author(self):
+        fanned, pulled = self.authors[:2]
+        self.subscribe(self.user, fanned)
+        self.subscribe(self.user, pulled)
+        self.subscribe(self.authors[2], pulled)
+        self.create_recipes()
+        self.assertEqual(
+            set(
+                FeedEntry.objects.filter(user=self.user).values_list(
+                    'author_id', flat=True
+                )
+            ),
+            {fanned.id},
+        )
+        self.assertEqual(self.get_feed_ids(), self.expected_ids())
+
+    def test_unfollow_back_to_fan_out_backfills_timelines(self):
+        fanned, pulled = self.authors[:2]
+        self.subscribe(self.user, fanned)
+        self.subscribe(self.user, pulled)
+        self.subscribe(self.authors[2], pulled)
+        self.create_recipes()
+        self.subscribe(self.authors[2], pulled, 'delete')
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.user, author=pulled).count(),
+            3,
+        )
+        self.assertEqual(self.get_feed_ids(), self.expected_ids())
+
+
+class IngredientsFilterTest(APITestCase):
+    """Recipes filtered by ingredients through the inverted index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = [
+            create_recipe(
+                cls.authors[0],
+                f'Рецепт {i}',
+                cls.tags[:1],
+                [cls.ingredients[j] for j in ing_numbers],
+            )
+            for i, ing_numbers in enumerate(
+                [[0, 1], [0, 1, 2], [2, 3], [0], [1, 2, 3]]
+            )
+        ]
+
+    def get_names(self, query):
+        response = self.client.get(f'/api/recipes/?limit=10&{query}')
+        self.assertEqual(response.status_code, 200)
+        return sorted(recipe['name'] for recipe in response.data['results'])
+
+    def test_filters(self):
+        ing = [ingredient.id for ingredient in self.ingredients]
+        cases = [
+            (f'ingredients_include={ing[0]},{ing[1]}', [0, 1]),
+            (
+                f'ingredients_include={ing[0]},{ing[1]}'
+                '&ingredients_missing=1',
+                [0, 1, 3],
+            ),
+            (f'ingredients_exclude={ing[2]}', [0, 3]),
+        ]
+        for limit in [constants.RECIPE_IDS_IN_MAX_LEN, 0]:
+            for query, numbers in cases:
+                with self.subTest(limit=limit, query=query), mock.patch.object(
+                    constants, 'RECIPE_IDS_IN_MAX_LEN', limit
+                ):
+                    self.assertEqual(
+                        self.get_names(query),
+                        [f'Рецепт {number}' for number in numbers],
+                    )
+
+    def test_large_recipe_id_set_is_not_inlined(self):
+        """Too many ids from index are replaced by a subquery."""
+
+        ing_id = self.ingredients[0].id
+        with mock.patch.object(
+            constants, 'RECIPE_IDS_IN_MAX_LEN', 1
+        ), CaptureQueriesContext(connection) as queries:
+            self.get_names(f'ingredients_include={ing_id}')
+        self.assertTrue(
+            any(
+                '"recipes_recipe"."id" IN (SELECT' in query['sql']
+                for query in queries.captured_queries
+            )
+        )
+
+    def test_invalid_ids(self):
+        for query in [
+            'ingredients_include=1.9',
+            'ingredients_exclude=a',
+            'ingredients_missing=1.5',
+        ]:
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/recipes/?{query}')
+                self.assertEqual(response.status_code, 400)
+
+
+def reload_urlconf():
+    """Rebuild URL patterns, which depend on ASYNC_VIEWS."""
+
+    for name in ['api.v1.urls', 'api.urls', settings.ROOT_URLCONF]:
+        importlib.reload(importlib.import_module(name))
+    clear_url_caches()
+
+
+class AsyncViewsTest(APITestCase):
+    """Async read views answer like the sync API, writes to the same
+    URLs are passed to sync views.
+
+    Headers are passed per request, AsyncClient drops ones given to
+    its constructor in Django 4.2.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.addClassCleanup(reload_urlconf)
+        cls.enterClassContext(override_settings(ASYNC_VIEWS=True))
+        reload_urlconf()
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.token = Token.objects.create(user=cls.user)
+        cls.author_token = Token.objects.create(user=cls.authors[0])
+        cls.recipe = create_recipe(
+            cls.authors[0], 'Рецепт', cls.tags[:1], cls.ingredients[:1]
+        )
+        cls.user.following.add(cls.authors[0])
+
+    def auth(self, token):
+        return {'Authorization': f'Token {token.key}'}
+
+    async def test_subscriptions(self):
+        response = await self.async_client.get(
+            '/api/users/subscriptions/', headers=self.auth(self.token)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [user['id'] for user in response.json()['results']],
+            [self.authors[0].id],
+        )
+        response = await self.async_client.get(
+            '/api/users/subscriptions/',
+            headers={'Authorization': 'Token invalid'},
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.headers['WWW-Authenticate'], 'Token')
+        response = await self.async_client.get('/api/users/subscriptions/')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_not_modified(self):
+        self.assertIs(resolve('/api/tags/').func.view_class, TagListView)
+        response = await self.async_client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), len(self.tags))
+        response = await self.async_client.get(
+            '/api/tags/', headers={'If-None-Match': response.headers['ETag']}
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    async def test_writes_use_sync_views(self):
+        response = await self.async_client.post(
+            '/api/recipes/', {}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.post(
+            '/api/recipes/',
+            {},
+            content_type='application/json',
+            headers=self.auth(self.token),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ingredients', response.json())
+        response = await self.async_client.post('/api/tags/')
+        self.assertEqual(response.status_code, 405)
+
+        url = f'/api/recipes/{self.recipe.id}/'
+        response = await self.async_client.delete(
+            url, headers=self.auth(self.token)
+        )
+        self.assertEqual(response.status_code, 403)
+        response = await self.async_client.delete(
+            url, headers=self.auth(self.author_token)
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(
+            await Recipe.objects.filter(id=self.recipe.id).aexists()
+        )
+
+
+@override_settings(INGREDIENT_SEARCH_INDEX=False)
+class IngredientSearchTest(APITestCase):
+    """Ingredient name filter without in-memory index."""
+
+    def test_prefix(self):
+        for name in ['Salt', 'salmon', 'Sugar', 'sal']:
+            Ingredient.objects.create(name=name, measurement_unit='г')
+        response = self.client.get('/api/ingredients/?name=SAL')
+        self.assertEqual(
+            sorted(ing['name'] for ing in response.data),
+            ['Salt', 'sal', 'salmon'],
+        )
+
+    def test_cyrillic_prefix_in_any_case(self):
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit='г')
+                for name in ['Соль', 'СОУС', 'соя', 'Сахар']
+            ]
+        )
+        Ingredient.objects.create(name='Солод', measurement_unit='г')
+        for value in ['со', 'СО', 'сО']:
+            with self.subTest(name=value):
+                response = self.client.get(f'/api/ingredients/?name={value}')
+                self.assertEqual(
+                    sorted(ing['name'] for ing in response.data),
+                    ['СОУС', 'Солод', 'Соль', 'соя'],
+                )
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plan')
+    def test_prefix_uses_lower_name_index(self):
+        queryset = IngredientFilter(
+            {'name': 'sal'}, Ingredient.objects.all()
+        ).qs
+        self.assertIn('recipes_ingredient_name_lower', queryset.explain())
@@ -0,0 +1,249 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import exceptions, permissions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from api.v1.filters import IngredientFilter, RecipeFilter
+from api.v1.mixins import catalog_etag
+from api.v1.pagination import KeysetPagination
+from api.v1.serializers import (
+    IngredientSerializer,
+    ReadRecipeSerializer,
+    SubscriptionSerializer,
+    TagSerializer,
+)
+from core import constants
+from core.versions import get_version_datetime
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import ingredient_index
+
+
+async def aget_object(queryset, **kwargs):
+    """Async version of get_object_or_404."""
+
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(
+            f'No {queryset.model._meta.object_name} matches the given query.'
+        )
+
+
+class AsyncReadView(View):
+    """View answering GET and HEAD with async ORM under ASGI, other
+    methods are passed to sync_view, so both share one URL.
+
+    Authentication and permissions follow DRF settings, responses are
+    always rendered as JSON. Catalog views with version_key answer with
+    ETag and Last-Modified like conditional_catalog.
+    """
+
+    sync_view = None
+    version_key = None
+    serializer_class = None
+    filterset_class = None
+    pagination_class = None
+    permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+    renderer = JSONRenderer()
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            if self.sync_view is None:
+                return await super().dispatch(request, *args, **kwargs)
+            return await sync_to_async(self.sync_view)(
+                request, *args, **kwargs
+            )
+
+        self.request = Request(
+            request,
+            authenticators=[
+                auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+            ],
+        )
+        if self.version_key is None:
+            return await self.respond(*args, **kwargs)
+        validators = await sync_to_async(self.get_validators)(request)
+        response = get_conditional_response(
+            request, **validators
+        ) or await self.respond(*args, **kwargs)
+        response.headers.setdefault('ETag', validators['etag'])
+        response.headers.setdefault(
+            'Last-Modified', http_date(validators['last_modified'])
+        )
+        return response
+
+    async def respond(self, *args, **kwargs):
+        try:
+            await self.initial(self.request)
+            response = await self.get(self.request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        return self.finalize_response(response)
+
+    def get_validators(self, request):
+        modified_at = get_version_datetime(self.version_key)
+        return {
+            'etag': quote_etag(catalog_etag(request, self.version_key)),
+            'last_modified': int(modified_at.timestamp()),
+        }
+
+    async def initial(self, request):
+        """Authenticate request and check permissions."""
+
+        await sync_to_async(lambda: request.user)()
+        for permission in self.permission_classes:
+            if not permission().has_permission(request, self):
+                if request.successful_authenticator is None:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied()
+
+    def handle_exception(self, exc):
+        if isinstance(
+            exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)
+        ):
+            authenticators = self.request.authenticators
+            if authenticators:
+                exc.auth_header = authenticators[0].authenticate_header(
+                    self.request
+                )
+            else:
+                exc.status_code = 403
+        response = exception_handler(
+            exc, {'view': self, 'request': self.request}
+        )
+        if response is None:
+            raise exc
+        response.exception = True
+        return response
+
+    def finalize_response(self, response):
+        response.accepted_renderer = self.renderer
+        response.accepted_media_type = self.renderer.media_type
+        response.renderer_context = {
+            'view': self,
+            'request': self.request,
+            'response': response,
+        }
+        return response.render()
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    async def filter_queryset(self, queryset):
+        """Filter queryset by filterset_class in a thread, because
+        some filters use caches and in-memory indexes.
+        """
+
+        if self.filterset_class is None:
+            return queryset
+        return await sync_to_async(DjangoFilterBackend().filter_queryset)(
+            self.request, queryset, self
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs['context'] = {'request': self.request, 'view': self}
+        return self.serializer_class(*args, **kwargs)
+
+    async def serialize(self, instance, many=False):
+        return self.get_serializer(instance, many=many).data
+
+
+class AsyncListView(AsyncReadView):
+    async def get(self, request, *args, **kwargs):
+        queryset = await self.filter_queryset(self.get_queryset())
+        if self.pagination_class is not None:
+            paginator = self.pagination_class()
+            page = await paginator.apaginate_queryset(queryset, request, self)
+            if page is not None:
+                data = await self.serialize(page, many=True)
+                return paginator.get_paginated_response(data)
+        items = [item async for item in queryset]
+        return Response(await self.serialize(items, many=True))
+
+
+class AsyncDetailView(AsyncReadView):
+    async def get(self, request, pk):
+        instance = await aget_object(self.get_queryset(), pk=pk)
+        return Response(await self.serialize(instance))
+
+
+class TagListView(AsyncListView):
+    queryset = Tag.objects.all()
+    serializer_class = TagSerializer
+    version_key = constants.TAGS_VERSION_KEY
+
+
+class TagDetailView(AsyncDetailView):
+    queryset = Tag.objects.all()
+    serializer_class = TagSerializer
+    version_key = constants.TAGS_VERSION_KEY
+
+
+class IngredientListView(AsyncListView):
+    queryset = Ingredient.objects.all()
+    serializer_class = IngredientSerializer
+    filterset_class = IngredientFilter
+    version_key = constants.INGREDIENTS_VERSION_KEY
+
+    async def get(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return await super().get(request, *args, **kwargs)
+        if settings.INGREDIENT_SEARCH_INDEX:
+            return Response(await sync_to_async(ingredient_index.search)(name))
+        queryset = await self.filter_queryset(self.get_queryset())
+        ingredients = [
+            ing async for ing in queryset[: constants.ING_SEARCH_LIMIT]
+        ]
+        return Response(await self.serialize(ingredients, many=True))
+
+
+class IngredientDetailView(AsyncDetailView):
+    queryset = Ingredient.objects.all()
+    serializer_class = IngredientSerializer
+    version_key = constants.INGREDIENTS_VERSION_KEY
+
+
+class RecipeReadMixin:
+    serializer_class = ReadRecipeSerializer
+
+    def get_queryset(self):
+        return Recipe.objects.with_user_flags(self.request.user)
+
+    async def serialize(self, instance, many=False):
+        """Serialize in a thread, because shared recipe data comes
+        from cache and missed recipes are prefetched.
+        """
+
+        return await sync_to_async(
+            lambda: self.get_serializer(instance, many=many).data
+        )()
+
+
+class RecipeListView(RecipeReadMixin, AsyncListView):
+    filterset_class = RecipeFilter
+    pagination_class = KeysetPagination
+
+
+class RecipeDetailView(RecipeReadMixin, AsyncDetailView):
+    pass
+
+
+class SubscriptionListView(AsyncListView):
+    serializer_class = SubscriptionSerializer
+    pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return SubscriptionSerializer.prepare_queryset(
+            self.request.user.following.all(), self.request
+        )
@@ -0,0 +1,66 @@
+import copy
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from core import constants
+from core.versions import get_version
+
+
+class TokenCache:
+    """Bounded LRU of token key -> (user, token, user version, expiry)."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[3] < monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, user, token, version):
+        with self._lock:
+            self._entries[key] = (user, token, version, monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication, which keeps users in per-process cache.
+
+    Cached user is valid until TTL expires or user's auth version stamp
+    changes, which happens on logout and on any change of the user.
+    """
+
+    cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+    def authenticate_credentials(self, key):
+        entry = self.cache.get(key)
+        if entry:
+            user, token, version, _ = entry
+            key_name = constants.USER_AUTH_VERSION_KEY.format(user.pk)
+            if version == get_version(key_name):
+                return copy.copy(user), token
+            self.cache.delete(key)
+
+        user, token = super().authenticate_credentials(key)
+        version = get_version(constants.USER_AUTH_VERSION_KEY.format(user.pk))
+        self.cache.set(key, copy.copy(user), token, version)
+        return user, token
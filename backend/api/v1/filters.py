@@ -1,7 +1,21 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django import forms
+from django.db.models import Count, Exists, F, OuterRef, Q
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe
+from core import constants
+from core.versions import get_version
+from recipes.fulltext import is_postgresql
+from recipes.models import (
+    Ingredient,
+    IngredientQuantity,
+    Recipe,
+    Tag,
+    normalize,
+)
+from recipes.search import recipe_ingredient_index
 
 User = get_user_model()
 
@@ -9,36 +23,153 @@ User = get_user_model()
 class IngredientFilter(FilterSet):
     """Filter for searching ingredients by name."""
 
-    name = filters.CharFilter(lookup_expr='istartswith')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ['name']
 
+    def filter_name(self, queryset, _, value):
+        """Filter by prefix of case folded name.
+
+        PostgreSQL serves LIKE prefix by varchar_pattern_ops index, other
+        databases serve equal range by plain name_lower index.
+        """
+
+        prefix = normalize(value)
+        if is_postgresql(connections[queryset.db]):
+            return queryset.filter(name_lower__startswith=prefix)
+        return queryset.filter(
+            name_lower__gte=prefix,
+            name_lower__lt=prefix[:-1] + chr(ord(prefix[-1]) + 1),
+        )
+
+
+def get_tag_map():
+    """Return {slug: id} of all tags, cached until tags change."""
+
+    version = get_version(constants.TAGS_VERSION_KEY)
+    entry = cache.get(constants.TAG_MAP_CACHE_KEY)
+    if entry and entry['version'] == version:
+        return entry['tags']
+    tags = dict(Tag.objects.values_list('slug', 'id'))
+    cache.set(
+        constants.TAG_MAP_CACHE_KEY,
+        {'version': version, 'tags': tags},
+        timeout=None,
+    )
+    return tags
+
+
+def tag_choices():
+    return [(slug, slug) for slug in get_tag_map()]
+
+
+class IntegerFilter(filters.NumberFilter):
+    field_class = forms.IntegerField
+
+
+class IntegerInFilter(filters.BaseInFilter, IntegerFilter):
+    """Filter by comma separated list of integers."""
+
 
 class RecipeFilter(FilterSet):
-    """Filter for searching recipes by author, tags.
+    """Filter for searching recipes by author, tags and full-text query.
     Also filters recipes by is_favorited and is_in_shopping_cart.
+
+    ingredients_include keeps recipes with all given ingredients, or,
+    when ingredients_missing is passed, recipes with some of them, which
+    need at most ingredients_missing other ingredients.
+    ingredients_exclude drops recipes with any of given ingredients.
     """
 
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices, method='filter_tags'
+    )
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
+    ingredients_include = IntegerInFilter(method='filter_ingredients_include')
+    ingredients_exclude = IntegerInFilter(method='filter_ingredients_exclude')
+    ingredients_missing = IntegerFilter(
+        method='filter_ingredients_missing', min_value=0
+    )
+    ordering = filters.OrderingFilter(fields=['created_at', 'favorites_count'])
 
     class Meta:
         model = Recipe
         fields = ['author', 'tags']
 
+    def filter_tags(self, queryset, _, value):
+        tag_map = get_tag_map()
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef('pk'),
+                    tag_id__in=[tag_map[slug] for slug in value],
+                )
+            )
+        )
+
+    def filter_search(self, queryset, _, value):
+        return queryset.search(value)
+
+    @staticmethod
+    def recipe_ids_lookup(recipe_ids, quantities):
+        """Return value for id__in lookup: recipe ids found by index,
+        or, when there are too many of them for one IN list, subquery
+        finding the same recipes by quantities in the database.
+        """
+
+        if len(recipe_ids) <= constants.RECIPE_IDS_IN_MAX_LEN:
+            return recipe_ids
+        return quantities.values('recipe_id')
+
+    def filter_ingredients_include(self, queryset, _, ing_ids):
+        max_missing = self.form.cleaned_data.get('ingredients_missing')
+        quantities = IngredientQuantity.objects.values('recipe_id')
+        if max_missing is None:
+            recipe_ids = recipe_ingredient_index.with_all(ing_ids)
+            quantities = (
+                quantities.filter(ingredient_id__in=ing_ids)
+                .annotate(matched=Count('ingredient_id', distinct=True))
+                .filter(matched=len(set(ing_ids)))
+            )
+        else:
+            recipe_ids = recipe_ingredient_index.missing_at_most(
+                ing_ids, max_missing
+            )
+            quantities = quantities.annotate(
+                matched=Count('id', filter=Q(ingredient_id__in=ing_ids)),
+                total=Count('id'),
+            ).filter(matched__gt=0, total__lte=F('matched') + max_missing)
+        return queryset.filter(
+            id__in=self.recipe_ids_lookup(recipe_ids, quantities)
+        )
+
+    def filter_ingredients_exclude(self, queryset, _, ing_ids):
+        return queryset.exclude(
+            id__in=self.recipe_ids_lookup(
+                recipe_ingredient_index.with_any(ing_ids),
+                IngredientQuantity.objects.filter(ingredient_id__in=ing_ids),
+            )
+        )
+
+    def filter_ingredients_missing(self, queryset, *_):
+        """Only modifies ingredients_include filter."""
+
+        return queryset
+
     def filter_is_favorited(self, queryset, _, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(favorites__id=user.id)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, _, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(shopping_cart__id=user.id)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
@@ -1,32 +1,143 @@
+import posixpath
+from base64 import b64decode
+from hashlib import md5, sha256
+from urllib.parse import urlparse
+
+from django.db.transaction import atomic
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import status
 from rest_framework.response import Response
 
+from core.metrics import timed_serialization
+from core.versions import get_version, get_version_datetime
+
 
 class CustomBase64ImageField(Base64ImageField):
-    """Custom field to prevent returning None instead of empty string."""
+    """Custom field to prevent returning None instead of empty string.
+
+    Represents image with given rendition, when it is ready. On update,
+    image equal to the current one, passed as base64 or as its URL,
+    is kept as is without decoding and saving it again.
+    """
 
     EMPTY_VALUES = ()
 
+    def __init__(self, *args, rendition=None, **kwargs):
+        self.rendition = rendition
+        super().__init__(*args, **kwargs)
+
+    def get_current_file(self, data):
+        """Return current file of updated instance, if data is the same."""
+
+        instance = getattr(self.parent, 'instance', None)
+        file = instance and getattr(instance, self.source, None)
+        if not file or not isinstance(data, str):
+            return None
+        if ';base64,' not in data:
+            urls = [file.url] + [
+                file.storage.url(name)
+                for name in file.instance.image_renditions.values()
+            ]
+            return file if urlparse(data).path in urls else None
+        try:
+            content = b64decode(data.split(';base64,', 1)[1])
+        except (TypeError, ValueError):
+            return None
+        digest = posixpath.splitext(posixpath.basename(file.name))[0]
+        return file if sha256(content).hexdigest() == digest else None
+
+    def to_internal_value(self, data):
+        return self.get_current_file(data) or super().to_internal_value(data)
+
+    def to_representation(self, file):
+        rendition = file and file.instance.image_renditions.get(self.rendition)
+        if not rendition:
+            return super().to_representation(file)
+        url = file.storage.url(rendition)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class TimedSerializerMixin:
+    """Mixin recording serializer time in request metrics.
+
+    Both data and to_representation are timed, so serializers overriding
+    to_representation and items of plain list serializers are counted.
+    """
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+    def to_representation(self, instance):
+        with timed_serialization():
+            return super().to_representation(instance)
+
+
+def catalog_etag(request, version_key):
+    """Return ETag of catalog response built from its version stamp."""
+
+    variant = request.get_full_path() + request.META.get('HTTP_ACCEPT', '')
+    variant_hash = md5(variant.encode(), usedforsecurity=False).hexdigest()
+    return f'{get_version(version_key)}-{variant_hash}'
+
+
+def conditional_catalog(version_key):
+    """Class decorator answering GET with ETag and Last-Modified
+    built from catalog version stamp, before any DB query is made.
+    """
+
+    def etag_func(request, *args, **kwargs):
+        return catalog_etag(request, version_key)
+
+    def last_modified_func(request, *args, **kwargs):
+        return get_version_datetime(version_key)
+
+    return method_decorator(
+        condition(etag_func=etag_func, last_modified_func=last_modified_func),
+        name='dispatch',
+    )
+
 
 class WriteMethodsMixinView:
     """Mixin with add and remove methods for objects in ViewSets."""
 
     @staticmethod
-    def add_obj(serializer):
+    def add_obj(serializer, **kwargs):
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        serializer.save(**kwargs)
         return Response(
             serializer.data,
             status=status.HTTP_201_CREATED,
         )
 
     @staticmethod
-    def remove_obj(field, obj_id, obj_name='Объект'):
-        if not field.filter(id=obj_id).exists():
+    def bulk_change(serializer, user, remove=False):
+        serializer.is_valid(raise_exception=True)
+        change = serializer.remove if remove else serializer.add
+        return Response(change(user))
+
+    @staticmethod
+    @atomic
+    def remove_obj(field, obj_id, obj_name='Объект', on_remove=None):
+        """Remove obj from many-to-many field with one DELETE
+        on the through model, rows deleted tell whether it was there.
+        """
+
+        deleted, _ = field.through.objects.filter(
+            **{
+                field.source_field_name: field.instance.pk,
+                field.target_field_name: obj_id,
+            }
+        ).delete()
+        if not deleted:
             return Response(
                 {'errors': f'{obj_name} с таким ID не найден!'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        field.remove(obj_id)
+        if on_remove:
+            on_remove()
         return Response(status=status.HTTP_204_NO_CONTENT)
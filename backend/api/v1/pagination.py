@@ -1,7 +1,173 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime
+
+from django.core.paginator import InvalidPage
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     """Enables page size alternating by passing limit in URL params."""
 
     page_size_query_param = 'limit'
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async version of paginate_queryset, using async ORM."""
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(
+                self.invalid_page_message.format(
+                    page_number=page_number, message=str(exc)
+                )
+            )
+        self.page.object_list = [item async for item in self.page.object_list]
+        self.request = request
+        return self.page.object_list
+
+
+class KeysetPagination(CustomPageNumberPagination):
+    """Page number pagination, which switches to keyset pagination
+    on (created_at, id) when cursor is passed in URL params.
+
+    Pass empty cursor for the first page, then follow next and previous
+    links. Keyset pages don't run COUNT and don't use OFFSET.
+    """
+
+    cursor_query_param = 'cursor'
+    keyset_field = 'created_at'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_keyset = self.cursor_query_param in request.query_params
+        if not self.use_keyset:
+            return super().paginate_queryset(queryset, request, view)
+        queryset = self.get_keyset_queryset(queryset, request)
+        return self.get_keyset_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.use_keyset = self.cursor_query_param in request.query_params
+        if not self.use_keyset:
+            return await super().apaginate_queryset(queryset, request, view)
+        queryset = self.get_keyset_queryset(queryset, request)
+        return self.get_keyset_page([item async for item in queryset])
+
+    def get_keyset_queryset(self, queryset, request, id_field='id'):
+        """Return queryset of the page by cursor, with one extra item.
+
+        id_field is the field of queryset holding id of keyset items.
+        """
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.position, self.reverse = self.decode_cursor(request)
+
+        field = self.keyset_field
+        if self.reverse:
+            queryset = queryset.order_by(field, id_field)
+        else:
+            queryset = queryset.order_by(f'-{field}', f'-{id_field}')
+        if self.position:
+            value, pk = self.position
+            lookup = 'gte' if self.reverse else 'lte'
+            queryset = queryset.filter(**{f'{field}__{lookup}': value})
+            id_lookup = 'lte' if self.reverse else 'gte'
+            queryset = queryset.exclude(
+                **{field: value, f'{id_field}__{id_lookup}': pk}
+            )
+        return queryset[: self.page_size + 1]
+
+    def get_keyset_page(self, results):
+        """Trim fetched results to the page and remember cursor items."""
+
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if self.reverse:
+            results.reverse()
+
+        position = self.position
+        has_next = position is not None if self.reverse else has_more
+        has_previous = has_more if self.reverse else position is not None
+        self.next_item = results[-1] if results and has_next else None
+        self.previous_item = results[0] if results and has_previous else None
+        return results
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            value, pk, reverse = json.loads(urlsafe_b64decode(cursor))
+            return (datetime.fromisoformat(value), int(pk)), bool(reverse)
+        except (BinasciiError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item, reverse):
+        position = [getattr(item, self.keyset_field).isoformat(), item.id]
+        cursor = urlsafe_b64encode(
+            json.dumps(position + [reverse]).encode()
+        ).decode()
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if not self.use_keyset:
+            return super().get_next_link()
+        if self.next_item is None:
+            return None
+        return self.encode_cursor(self.next_item, False)
+
+    def get_previous_link(self):
+        if not self.use_keyset:
+            return super().get_previous_link()
+        if self.previous_item is None:
+            return None
+        return self.encode_cursor(self.previous_item, True)
+
+    def get_paginated_response(self, data):
+        if not self.use_keyset:
+            return super().get_paginated_response(data)
+        return Response(
+            {
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link(),
+                'results': data,
+            }
+        )
+
+
+class FeedPagination(KeysetPagination):
+    """Keyset pagination of feed merged from several sources.
+
+    Every source is ordered and cut to a page by its own index, then
+    pages are merged by (created_at, recipe id). Cursor is optional.
+    """
+
+    def paginate_sources(self, sources, request):
+        """Return recipe ids of the page with one extra id.
+
+        sources are (queryset, recipe id field) pairs.
+        """
+
+        self.use_keyset = True
+        keys = set()
+        for queryset, id_field in sources:
+            keys.update(
+                self.get_keyset_queryset(
+                    queryset, request, id_field
+                ).values_list(self.keyset_field, id_field)
+            )
+        keys = sorted(keys, reverse=not self.reverse)
+        return [pk for _, pk in keys[: self.page_size + 1]]
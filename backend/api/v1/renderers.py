@@ -0,0 +1,87 @@
+import csv
+import json
+
+from rest_framework import renderers
+
+
+class ShoppingCartTextRenderer(renderers.BaseRenderer):
+    """Renders shopping cart as plain text, line by line."""
+
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    key_names = {
+        'ingredient__name': 'Ингредиент',
+        'ingredient__measurement_unit': 'Мера измерения',
+        'amount': 'Количество',
+    }
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Render error responses, cart itself is sent by stream()."""
+
+        if data is None:
+            return b''
+        return '\n'.join(
+            f'{key}: {value}' for key, value in data.items()
+        ).encode(self.charset)
+
+    def stream(self, ingredients):
+        yield 'Список покупок:\n'
+        for ing in ingredients:
+            yield ''.join(
+                f'{self.key_names[key]}: {val}; ' for key, val in ing.items()
+            ) + '\n'
+
+
+class ShoppingCartCSVRenderer(ShoppingCartTextRenderer):
+    """Renders shopping cart as CSV, row by row."""
+
+    media_type = 'text/csv'
+    format = 'csv'
+
+    class Echo:
+        """File-like object, which returns written value."""
+
+        def write(self, value):
+            return value
+
+    def stream(self, ingredients):
+        writer = csv.writer(self.Echo())
+        yield writer.writerow(self.key_names.values())
+        for ing in ingredients:
+            yield writer.writerow(ing.values())
+
+
+class ShoppingCartJSONRenderer(renderers.JSONRenderer):
+    """Renders shopping cart as JSON array, item by item."""
+
+    charset = 'utf-8'
+    key_names = {
+        'ingredient__name': 'name',
+        'ingredient__measurement_unit': 'measurement_unit',
+        'amount': 'amount',
+    }
+
+    def stream(self, ingredients):
+        separator = '['
+        for ing in ingredients:
+            item = {self.key_names[key]: val for key, val in ing.items()}
+            yield separator + json.dumps(item, ensure_ascii=False)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+
+class PrometheusRenderer(renderers.BaseRenderer):
+    """Renders metrics, already formatted as Prometheus text."""
+
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return '\n'.join(
+            f'{key}: {value}' for key, value in (data or {}).items()
+        ).encode(self.charset)
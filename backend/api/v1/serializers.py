@@ -1,292 +1,732 @@
-from django.contrib.auth import get_user_model
-from django.db.models import F
-from django.db.transaction import atomic
-from rest_framework import serializers
-
-from api.v1.mixins import CustomBase64ImageField
-from recipes.models import (
-    FavoriteRecipes,
-    Ingredient,
-    IngredientQuantity,
-    Recipe,
-    ShoppingCart,
-    Tag,
-)
-from users.models import FollowRelationship
-
-User = get_user_model()
-
-
-class IngredientsField(serializers.Field):
-    """Custom field for ingredients."""
-
-    default_error_messages = {
-        'empty_list': 'Не выбрано ни одного ингредиента.',
-        'incorrect_type': (
-            'Неверный тип ингредиента, ожидается: dict, получен: {ing_type}.'
-        ),
-        'incorrect_keys': (
-            'Неверные ключи словаря, ожидаются: {id, amount}, получены:'
-            ' {ing_keys}.'
-        ),
-        'ing_not_exist': 'Ингредиент с id {ing_id} не существует.',
-        'amount_less_than_1': (
-            'Количество ингредиента {ing_id} не может быть меньше 1.'
-        ),
-        'ing_repeat': 'Ингредиент {ing_id} передан больше 1 раза.',
-    }
-
-    def to_representation(self, ingredients):
-        return ingredients.values().annotate(
-            amount=F('ingredientquantity__amount')
-        )
-
-    def to_internal_value(self, ingredients):
-        if not ingredients:
-            self.fail('empty_list')
-
-        used_ingredients = set()
-        for ingredient in ingredients:
-            if not isinstance(ingredient, dict):
-                self.fail('incorrect_type', ing_type=type(ingredient))
-
-            if set(ingredient.keys()) != {'id', 'amount'}:
-                self.fail('incorrect_keys', ing_keys=ingredient.keys())
-
-            ing_id = ingredient['id']
-
-            if not Ingredient.objects.filter(id=ing_id).exists():
-                self.fail('ing_not_exist', ing_id=ing_id)
-
-            if int(ingredient['amount']) < 1:
-                self.fail('amount_less_than_1', ing_id=ing_id)
-
-            if ing_id in used_ingredients:
-                self.fail('ing_repeat', ing_id=ing_id)
-
-            used_ingredients.add(ing_id)
-
-        return ingredients
-
-
-class TagsField(serializers.Field):
-    """Custom field for tags."""
-
-    default_error_messages = {
-        'empty_list': 'Не выбрано ни одного тега.',
-        'incorrect_type': (
-            'Неверный тип тега, ожидается: int, получен: {tag_id_type}.'
-        ),
-        'tag_not_exist': 'Тег с id {tag_id} не существует.',
-        'tag_repeat': 'Тег {tag_id} передан больше 1 раза.',
-    }
-
-    def to_representation(self, tags):
-        return tags.values()
-
-    def to_internal_value(self, tags):
-        if not tags:
-            self.fail('empty_list')
-
-        used_tags = set()
-        for tag_id in tags:
-            if not isinstance(tag_id, int):
-                self.fail('incorrect_type', tag_id_type=type(tag_id))
-
-            if not Tag.objects.filter(id=tag_id).exists():
-                self.fail('tag_not_exist', tag_id=tag_id)
-
-            if tag_id in used_tags:
-                self.fail('tag_repeat', tag_id=tag_id)
-
-            used_tags.add(tag_id)
-
-        return tags
-
-
-class UserSerializer(serializers.ModelSerializer):
-    is_subscribed = serializers.SerializerMethodField()
-
-    class Meta:
-        model = User
-        fields = [
-            'email',
-            'id',
-            'username',
-            'password',
-            'first_name',
-            'last_name',
-            'is_subscribed',
-        ]
-        read_only_fields = ['id', 'is_subscribed']
-        extra_kwargs = {'password': {'write_only': True}}
-
-    def get_is_subscribed(self, user):
-        request = self.context.get('request')
-        return (
-            request
-            and request.user.is_authenticated
-            and request.user.following.filter(id=user.id).exists()
-        )
-
-
-class SubscriptionSerializer(UserSerializer):
-    """Serializer for subscriptions endpoints."""
-
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
-
-    class Meta:
-        model = User
-        fields = UserSerializer.Meta.fields + ['recipes', 'recipes_count']
-        read_only_fields = ['id']
-        extra_kwargs = {'password': {'write_only': True}}
-
-    def get_recipes(self, user):
-        limit = self.context.get('request').GET.get('recipes_limit')
-        try:
-            recipes = user.recipes.all()[: int(limit)]
-        except (TypeError, ValueError):
-            recipes = user.recipes.all()
-
-        serializer = ShortRecipeSerializer(recipes, many=True, read_only=True)
-        return serializer.data
-
-    def get_recipes_count(self, user):
-        return user.recipes.count()
-
-    def to_representation(self, user):
-        return super(UserSerializer, self).to_representation(user)
-
-
-class IngredientSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Ingredient
-        fields = ['id', 'name', 'measurement_unit']
-
-
-class TagSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Tag
-        fields = ['id', 'name', 'color', 'slug']
-
-
-class ShortRecipeSerializer(serializers.ModelSerializer):
-    """Serializer for providing recipe shortcut in some endpoints."""
-
-    image = CustomBase64ImageField()
-
-    class Meta:
-        model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
-        read_only_fields = ['__all__']
-
-
-class ReadRecipeSerializer(ShortRecipeSerializer):
-    """Serializer for providing full recipe data."""
-
-    ingredients = IngredientsField()
-    tags = TagsField()
-    author = UserSerializer(read_only=True)
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Recipe
-        exclude = ['favorites', 'shopping_cart', 'created_at']
-
-    def get_is_favorited(self, recipe):
-        request = self.context.get('request')
-        return (
-            request
-            and request.user.is_authenticated
-            and request.user in recipe.favorites.all()
-        )
-
-    def get_is_in_shopping_cart(self, recipe):
-        request = self.context.get('request')
-        return (
-            request
-            and request.user.is_authenticated
-            and request.user in recipe.shopping_cart.all()
-        )
-
-
-class WriteRecipeSerializer(ReadRecipeSerializer):
-    """Serializer for saving and updating recipes."""
-
-    @staticmethod
-    def ingredientquantity_bulk_create(recipe, ingredients):
-        """Bulk creation for related ingredients."""
-
-        IngredientQuantity.objects.bulk_create(
-            [
-                IngredientQuantity(
-                    recipe=recipe,
-                    ingredient_id=ing['id'],
-                    amount=ing['amount'],
-                )
-                for ing in ingredients
-            ]
-        )
-
-    @atomic
-    def create(self, validated_data):
-        request = self.context.get('request')
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        recipe = Recipe(author=request.user, **validated_data)
-        recipe.save()
-        recipe.tags.set(tags)
-        self.ingredientquantity_bulk_create(recipe, ingredients)
-        request.user.favorites.add(recipe.id)
-        return recipe
-
-    @atomic
-    def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        instance = super().update(
-            instance=instance, validated_data=validated_data
-        )
-        instance.ingredients.clear()
-        self.ingredientquantity_bulk_create(instance, ingredients)
-        return instance
-
-
-class SaveFavoriteSerializer(serializers.ModelSerializer):
-    """Serializer for saving user's favorite recipes."""
-
-    class Meta:
-        model = FavoriteRecipes
-        fields = ['user', 'recipe']
-
-    def to_representation(self, instance):
-        return ShortRecipeSerializer(instance.recipe).data
-
-
-class SaveShoppingCartSerializer(SaveFavoriteSerializer):
-    """Serializer for adding recipes to user's shopping cart."""
-
-    class Meta:
-        model = ShoppingCart
-        fields = ['user', 'recipe']
-
-
-class SaveSubscriptionSerializer(serializers.ModelSerializer):
-    """Serializer for saving users subscriptions."""
-
-    class Meta:
-        model = FollowRelationship
-        exclude = ['created_at']
-
-    def validate(self, data):
-        if data['from_user'] == data['to_user']:
-            raise serializers.ValidationError(
-                'Нельзя подписаться на самого себя!'
-            )
-        return data
-
-    def to_representation(self, instance):
-        return SubscriptionSerializer(
-            instance.to_user, context={'request': self.context.get('request')}
-        ).data
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import IntegrityError
+from django.db.models import (
+    F,
+    Manager,
+    Prefetch,
+    Value,
+    prefetch_related_objects,
+)
+from django.db.models.functions import Greatest
+from django.db.transaction import atomic
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from api.v1.mixins import CustomBase64ImageField, TimedSerializerMixin
+from core import constants
+from core.versions import get_version
+from recipes.images import schedule_image_processing
+from recipes.models import (
+    FavoriteRecipes,
+    FeedEntry,
+    Ingredient,
+    IngredientQuantity,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from users.models import FollowRelationship
+
+User = get_user_model()
+
+
+def get_missing_ids(model, ids):
+    """Return comma separated ids absent in model table, using one query."""
+
+    existing_ids = {
+        str(obj_id)
+        for obj_id in model.objects.filter(id__in=ids).values_list(
+            'id', flat=True
+        )
+    }
+    return ', '.join(
+        str(obj_id) for obj_id in ids if str(obj_id) not in existing_ids
+    )
+
+
+class IngredientsField(serializers.Field):
+    """Custom field for ingredients."""
+
+    default_error_messages = {
+        'empty_list': 'Не выбрано ни одного ингредиента.',
+        'incorrect_type': (
+            'Неверный тип ингредиента, ожидается: dict, получен: {ing_type}.'
+        ),
+        'incorrect_keys': (
+            'Неверные ключи словаря, ожидаются: {id, amount}, получены:'
+            ' {ing_keys}.'
+        ),
+        'ing_not_exist': 'Ингредиенты с id {ing_ids} не существуют.',
+        'amount_less_than_1': (
+            'Количество ингредиента {ing_id} не может быть меньше 1.'
+        ),
+        'ing_repeat': 'Ингредиент {ing_id} передан больше 1 раза.',
+    }
+
+    def get_attribute(self, recipe):
+        return recipe.ingredientquantity_set.all()
+
+    def to_representation(self, quantities):
+        return [
+            {
+                'id': quantity.ingredient.id,
+                'name': quantity.ingredient.name,
+                'measurement_unit': quantity.ingredient.measurement_unit,
+                'amount': quantity.amount,
+            }
+            for quantity in quantities
+        ]
+
+    def to_internal_value(self, ingredients):
+        if not ingredients:
+            self.fail('empty_list')
+
+        used_ingredients = set()
+        for ingredient in ingredients:
+            if not isinstance(ingredient, dict):
+                self.fail('incorrect_type', ing_type=type(ingredient))
+
+            if set(ingredient.keys()) != {'id', 'amount'}:
+                self.fail('incorrect_keys', ing_keys=ingredient.keys())
+
+            ing_id = ingredient['id']
+
+            if int(ingredient['amount']) < 1:
+                self.fail('amount_less_than_1', ing_id=ing_id)
+
+            if ing_id in used_ingredients:
+                self.fail('ing_repeat', ing_id=ing_id)
+
+            used_ingredients.add(ing_id)
+
+        missing_ids = get_missing_ids(
+            Ingredient, [ingredient['id'] for ingredient in ingredients]
+        )
+        if missing_ids:
+            self.fail('ing_not_exist', ing_ids=missing_ids)
+
+        return ingredients
+
+
+class TagsField(serializers.Field):
+    """Custom field for tags."""
+
+    default_error_messages = {
+        'empty_list': 'Не выбрано ни одного тега.',
+        'incorrect_type': (
+            'Неверный тип тега, ожидается: int, получен: {tag_id_type}.'
+        ),
+        'tag_not_exist': 'Теги с id {tag_ids} не существуют.',
+        'tag_repeat': 'Тег {tag_id} передан больше 1 раза.',
+    }
+
+    def to_representation(self, tags):
+        return TagSerializer(tags.all(), many=True).data
+
+    def to_internal_value(self, tags):
+        if not tags:
+            self.fail('empty_list')
+
+        used_tags = set()
+        for tag_id in tags:
+            if not isinstance(tag_id, int):
+                self.fail('incorrect_type', tag_id_type=type(tag_id))
+
+            if tag_id in used_tags:
+                self.fail('tag_repeat', tag_id=tag_id)
+
+            used_tags.add(tag_id)
+
+        missing_ids = get_missing_ids(Tag, tags)
+        if missing_ids:
+            self.fail('tag_not_exist', tag_ids=missing_ids)
+
+        return tags
+
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    is_subscribed = serializers.SerializerMethodField()
+
+    class Meta:
+        model = User
+        fields = [
+            'email',
+            'id',
+            'username',
+            'password',
+            'first_name',
+            'last_name',
+            'is_subscribed',
+        ]
+        read_only_fields = ['id', 'is_subscribed']
+        extra_kwargs = {'password': {'write_only': True}}
+
+    def get_is_subscribed(self, user):
+        request = self.context.get('request')
+        if not (request and request.user.is_authenticated):
+            return False
+        if hasattr(user, 'is_subscribed'):
+            return user.is_subscribed
+        return request.user.following.filter(id=user.id).exists()
+
+
+class SubscriptionSerializer(UserSerializer):
+    """Serializer for subscriptions endpoints."""
+
+    recipes = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = User
+        fields = UserSerializer.Meta.fields + ['recipes', 'recipes_count']
+        read_only_fields = ['id']
+        extra_kwargs = {'password': {'write_only': True}}
+
+    @staticmethod
+    def prepare_queryset(queryset, request):
+        """Prefetch recipes for a queryset of followed authors.
+
+        Recipes of all authors are fetched in one query, limited per author
+        by recipes_limit with ROW_NUMBER window.
+        """
+
+        recipes = Recipe.objects.all()
+        try:
+            recipes = recipes[: int(request.GET.get('recipes_limit'))]
+        except (TypeError, ValueError):
+            pass
+        return queryset.annotate(is_subscribed=Value(True)).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
+
+    def get_recipes(self, user):
+        serializer = ShortRecipeSerializer(
+            user.limited_recipes, many=True, read_only=True
+        )
+        return serializer.data
+
+    def to_representation(self, user):
+        return super(UserSerializer, self).to_representation(user)
+
+
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Ingredient
+        fields = ['id', 'name', 'measurement_unit']
+
+
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ['id', 'name', 'color', 'slug']
+
+
+class ShortRecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Serializer for providing recipe shortcut in some endpoints."""
+
+    image = CustomBase64ImageField(rendition='card')
+
+    class Meta:
+        model = Recipe
+        fields = ['id', 'name', 'image', 'cooking_time']
+        read_only_fields = ['__all__']
+
+
+class RecipeDataSerializer(ShortRecipeSerializer):
+    """Serializer for recipe data, which is the same for every viewer.
+
+    Used without request in context, so image URL is relative.
+    """
+
+    image = CustomBase64ImageField(rendition='detail')
+    images = serializers.SerializerMethodField()
+    ingredients = IngredientsField()
+    tags = TagsField()
+    author = UserSerializer(read_only=True)
+
+    class Meta:
+        model = Recipe
+        exclude = [
+            'favorites',
+            'shopping_cart',
+            'created_at',
+            'updated_at',
+            'image_renditions',
+        ]
+
+    def get_images(self, recipe):
+        """Return URLs of all ready image renditions."""
+
+        return {
+            name: recipe.image.storage.url(rendition)
+            for name, rendition in recipe.image_renditions.items()
+        }
+
+
+def get_recipes_data(recipes):
+    """Return viewer independent data of recipes as {recipe.id: data}.
+
+    Data is taken from recipes cache where possible, entries made before
+    the recipe, tags or ingredients last changed are ignored. Missed
+    recipes are prefetched and serialized in bulk.
+    """
+
+    cache = caches[constants.RECIPES_CACHE]
+    catalog_version = (
+        get_version(constants.TAGS_VERSION_KEY),
+        get_version(constants.INGREDIENTS_VERSION_KEY),
+    )
+    versions = {
+        recipe.id: (*catalog_version, recipe.updated_at) for recipe in recipes
+    }
+    keys = {
+        recipe.id: constants.RECIPE_DATA_CACHE_KEY.format(recipe.id)
+        for recipe in recipes
+    }
+    cached = cache.get_many(keys.values())
+    recipes_data = {}
+    missed = []
+    for recipe in recipes:
+        entry = cached.get(keys[recipe.id])
+        if entry and entry['version'] == versions[recipe.id]:
+            recipes_data[recipe.id] = entry['data']
+        else:
+            missed.append(recipe)
+
+    if missed:
+        prefetch_related_objects(missed, *Recipe.objects.related_lookups())
+        missed_data = {
+            recipe.id: RecipeDataSerializer(recipe).data for recipe in missed
+        }
+        cache.set_many(
+            {
+                keys[recipe_id]: {
+                    'version': versions[recipe_id],
+                    'data': data,
+                }
+                for recipe_id, data in missed_data.items()
+            },
+            constants.RECIPE_DATA_CACHE_TIMEOUT,
+        )
+        recipes_data.update(missed_data)
+    return recipes_data
+
+
+class ReadRecipeListSerializer(
+    TimedSerializerMixin, serializers.ListSerializer
+):
+    """Reads data of all recipes on a page from cache at once."""
+
+    def to_representation(self, recipes):
+        if isinstance(recipes, Manager):
+            recipes = recipes.all()
+        recipes = list(recipes)
+        recipes_data = get_recipes_data(recipes)
+        return [
+            self.child.add_viewer_data(
+                recipes_data[recipe.id], recipe, rendition='card'
+            )
+            for recipe in recipes
+        ]
+
+
+class ReadRecipeSerializer(RecipeDataSerializer):
+    """Serializer for providing full recipe data.
+
+    Shared recipe data comes from cache, fields depending on viewer
+    are added on top of it.
+    """
+
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
+
+    class Meta(RecipeDataSerializer.Meta):
+        list_serializer_class = ReadRecipeListSerializer
+
+    def _get_user_flag(self, recipe, flag, get_queryset):
+        """Return annotated flag if present, otherwise query for it."""
+
+        request = self.context.get('request')
+        if not (request and request.user.is_authenticated):
+            return False
+        if hasattr(recipe, flag):
+            return getattr(recipe, flag)
+        return get_queryset(request.user).exists()
+
+    def get_is_favorited(self, recipe):
+        return self._get_user_flag(
+            recipe,
+            'is_favorited',
+            lambda user: recipe.favorites.filter(id=user.id),
+        )
+
+    def get_is_in_shopping_cart(self, recipe):
+        return self._get_user_flag(
+            recipe,
+            'is_in_shopping_cart',
+            lambda user: recipe.shopping_cart.filter(id=user.id),
+        )
+
+    def get_is_author_subscribed(self, recipe):
+        return self._get_user_flag(
+            recipe,
+            'is_author_subscribed',
+            lambda user: user.following.filter(id=recipe.author_id),
+        )
+
+    def add_viewer_data(self, recipe_data, recipe, rendition='detail'):
+        request = self.context.get('request')
+        viewer_data = {
+            'is_favorited': self.get_is_favorited(recipe),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(recipe),
+            'author': {
+                **recipe_data['author'],
+                'is_subscribed': self.get_is_author_subscribed(recipe),
+            },
+            'favorites_count': recipe.favorites_count,
+        }
+        image = recipe_data['images'].get(rendition) or recipe_data['image']
+        images = recipe_data['images']
+        if request:
+            image = image and request.build_absolute_uri(image)
+            images = {
+                name: request.build_absolute_uri(url)
+                for name, url in images.items()
+            }
+        viewer_data['image'] = image
+        viewer_data['images'] = images
+        return {
+            name: viewer_data.get(name, recipe_data.get(name))
+            for name, field in self.fields.items()
+            if not field.write_only
+        }
+
+    def to_representation(self, recipe):
+        return self.add_viewer_data(
+            get_recipes_data([recipe])[recipe.id], recipe
+        )
+
+
+class WriteRecipeSerializer(ReadRecipeSerializer):
+    """Serializer for saving and updating recipes."""
+
+    @staticmethod
+    def ingredientquantity_bulk_create(recipe, ingredients):
+        """Bulk creation for related ingredients."""
+
+        IngredientQuantity.objects.bulk_create(
+            [
+                IngredientQuantity(
+                    recipe=recipe,
+                    ingredient_id=ing['id'],
+                    amount=ing['amount'],
+                )
+                for ing in ingredients
+            ]
+        )
+
+    @atomic
+    def create(self, validated_data):
+        request = self.context.get('request')
+        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags')
+        recipe = Recipe(
+            author=request.user, favorites_count=1, **validated_data
+        )
+        recipe.save()
+        recipe.tags.set(tags)
+        self.ingredientquantity_bulk_create(recipe, ingredients)
+        request.user.favorites.add(recipe.id)
+        User.objects.filter(id=request.user.id).update(
+            recipes_count=F('recipes_count') + 1
+        )
+        schedule_image_processing(recipe)
+        return recipe
+
+    @staticmethod
+    def update_tags(recipe, tag_ids):
+        """Delete and insert only changed recipe tags."""
+
+        through = Recipe.tags.through
+        old_ids = set(
+            through.objects.filter(recipe=recipe).values_list(
+                'tag_id', flat=True
+            )
+        )
+        new_ids = set(tag_ids)
+        if old_ids - new_ids:
+            through.objects.filter(
+                recipe=recipe, tag_id__in=old_ids - new_ids
+            ).delete()
+        through.objects.bulk_create(
+            [
+                through(recipe=recipe, tag_id=tag_id)
+                for tag_id in new_ids - old_ids
+            ]
+        )
+
+    @staticmethod
+    def update_ingredients(recipe, old_quantities, new_amounts):
+        """Delete, update and insert only changed ingredient quantities.
+
+        old_quantities is {ingredient_id: (quantity_id, amount)}.
+        """
+
+        removed = [
+            pk
+            for ing_id, (pk, _) in old_quantities.items()
+            if ing_id not in new_amounts
+        ]
+        if removed:
+            IngredientQuantity.objects.filter(id__in=removed).delete()
+        changed = [
+            IngredientQuantity(id=pk, amount=new_amounts[ing_id])
+            for ing_id, (pk, amount) in old_quantities.items()
+            if ing_id in new_amounts and new_amounts[ing_id] != amount
+        ]
+        if changed:
+            IngredientQuantity.objects.bulk_update(changed, ['amount'])
+        IngredientQuantity.objects.bulk_create(
+            [
+                IngredientQuantity(
+                    recipe=recipe, ingredient_id=ing_id, amount=amount
+                )
+                for ing_id, amount in new_amounts.items()
+                if ing_id not in old_quantities
+            ]
+        )
+
+    @atomic
+    def update(self, instance, validated_data):
+        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags')
+        quantities = instance.ingredientquantity_set.values_list(
+            'ingredient_id', 'id', 'amount'
+        )
+        old_quantities = {
+            ing_id: (pk, amount) for ing_id, pk, amount in quantities
+        }
+        new_amounts = {
+            int(ing['id']): int(ing['amount']) for ing in ingredients
+        }
+        old_image = instance.image.name
+        instance = super().update(
+            instance=instance, validated_data=validated_data
+        )
+        if instance.image.name != old_image:
+            instance.image_renditions = {}
+            instance.save(update_fields=['image_renditions'])
+            schedule_image_processing(instance)
+        self.update_tags(instance, tags)
+        self.update_ingredients(instance, old_quantities, new_amounts)
+        ShoppingListItem.objects.apply_deltas(
+            instance.shopping_cart.values_list('id', flat=True),
+            {
+                ing_id: new_amounts.get(ing_id, 0)
+                - old_quantities.get(ing_id, (None, 0))[1]
+                for ing_id in old_quantities.keys() | new_amounts.keys()
+            },
+        )
+        return instance
+
+    def to_representation(self, recipe):
+        request = self.context.get('request')
+        recipe = Recipe.objects.with_user_flags(request.user).get(pk=recipe.pk)
+        return super().to_representation(recipe)
+
+
+class SaveFavoriteSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
+    """Serializer for saving user's favorite recipes.
+
+    Duplicates are caught by the unique constraint on insert,
+    instead of checking for them with a query beforehand.
+    """
+
+    duplicate_error = 'Рецепт уже в избранном!'
+
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+
+    class Meta:
+        model = FavoriteRecipes
+        fields = ['user', 'recipe']
+        validators = []
+
+    @atomic
+    def create(self, validated_data):
+        try:
+            with atomic():
+                instance = super().create(validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError({'errors': self.duplicate_error})
+        self.on_create(instance)
+        return instance
+
+    def on_create(self, instance):
+        Recipe.objects.filter(id=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1
+        )
+
+    def to_representation(self, instance):
+        return ShortRecipeSerializer(instance.recipe).data
+
+
+class SaveShoppingCartSerializer(SaveFavoriteSerializer):
+    """Serializer for adding recipes to user's shopping cart."""
+
+    duplicate_error = 'Рецепт уже в корзине покупок!'
+
+    class Meta:
+        model = ShoppingCart
+        fields = ['user', 'recipe']
+        validators = []
+
+    def on_create(self, instance):
+        ShoppingListItem.objects.add_recipe(
+            [instance.user_id], instance.recipe_id
+        )
+
+
+class BulkFavoriteSerializer(serializers.Serializer):
+    """Serializer for adding or removing many favorite recipes at once.
+
+    Returns outcome for every recipe id: added, exists, removed
+    or not_found.
+    """
+
+    model = FavoriteRecipes
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=constants.BULK_RECIPES_MAX_LEN,
+    )
+
+    def validate_recipes(self, recipe_ids):
+        return list(dict.fromkeys(recipe_ids))
+
+    def get_user_recipe_ids(self, user, recipe_ids):
+        """Lock user row, so concurrent bulk requests of the user wait,
+        and return ids of user's recipes among given ones.
+        """
+
+        User.objects.select_for_update().filter(id=user.id).first()
+        return set(
+            self.model.objects.filter(
+                user=user, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True)
+        )
+
+    @atomic
+    def add(self, user):
+        recipe_ids = self.validated_data['recipes']
+        existing = self.get_user_recipe_ids(user, recipe_ids)
+        found = set(
+            Recipe.objects.filter(id__in=recipe_ids).values_list(
+                'id', flat=True
+            )
+        )
+        added = [pk for pk in recipe_ids if pk in found and pk not in existing]
+        self.model.objects.bulk_create(
+            [self.model(user=user, recipe_id=pk) for pk in added],
+            ignore_conflicts=True,
+        )
+        if added:
+            self.on_add(user, added)
+        return self.outcomes(
+            recipe_ids,
+            {pk: 'added' for pk in added} | {pk: 'exists' for pk in existing},
+        )
+
+    @atomic
+    def remove(self, user):
+        recipe_ids = self.validated_data['recipes']
+        removed = self.get_user_recipe_ids(user, recipe_ids)
+        if removed:
+            self.model.objects.filter(
+                user=user, recipe_id__in=removed
+            ).delete()
+            self.on_remove(user, list(removed))
+        return self.outcomes(recipe_ids, dict.fromkeys(removed, 'removed'))
+
+    @staticmethod
+    def outcomes(recipe_ids, statuses):
+        return {
+            'recipes': [
+                {'id': pk, 'status': statuses.get(pk, 'not_found')}
+                for pk in recipe_ids
+            ]
+        }
+
+    def on_add(self, user, recipe_ids):
+        Recipe.objects.filter(id__in=recipe_ids).update(
+            favorites_count=F('favorites_count') + 1
+        )
+
+    def on_remove(self, user, recipe_ids):
+        Recipe.objects.filter(id__in=recipe_ids).update(
+            favorites_count=Greatest(F('favorites_count') - 1, 0)
+        )
+
+
+class BulkShoppingCartSerializer(BulkFavoriteSerializer):
+    """Serializer for adding or removing many recipes in shopping cart."""
+
+    model = ShoppingCart
+
+    def on_add(self, user, recipe_ids):
+        ShoppingListItem.objects.add_recipes([user.id], recipe_ids)
+
+    def on_remove(self, user, recipe_ids):
+        ShoppingListItem.objects.remove_recipes([user.id], recipe_ids)
+
+
+class SaveSubscriptionSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
+    """Serializer for saving users subscriptions.
+
+    Users are passed to save(), duplicates are caught by the unique
+    constraint on insert.
+    """
+
+    class Meta:
+        model = FollowRelationship
+        exclude = ['created_at']
+        read_only_fields = ['from_user', 'to_user']
+        validators = []
+
+    @atomic
+    def create(self, validated_data):
+        if validated_data['from_user'] == validated_data['to_user']:
+            raise serializers.ValidationError(
+                {
+                    api_settings.NON_FIELD_ERRORS_KEY: [
+                        'Нельзя подписаться на самого себя!'
+                    ]
+                }
+            )
+        try:
+            with atomic():
+                instance = super().create(validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError(
+                {'errors': 'Вы уже подписаны на этого пользователя!'}
+            )
+        User.objects.filter(id=instance.to_user_id).update(
+            followers_count=F('followers_count') + 1
+        )
+        FeedEntry.objects.follow(instance.from_user_id, instance.to_user_id)
+        return instance
+
+    def to_representation(self, instance):
+        request = self.context.get('request')
+        queryset = SubscriptionSerializer.prepare_queryset(
+            User.objects.filter(id=instance.to_user_id), request
+        )
+        return SubscriptionSerializer(
+            queryset.get(), context={'request': request}
+        ).data
@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from api.v1 import async_views
 from api.v1.views import (
     IngredientViewSet,
+    MetricsView,
     RecipeViewSet,
     TagViewSet,
     UserModelViewSet,
@@ -17,4 +20,52 @@ v1_router.register('users', UserModelViewSet, basename='user')
 urlpatterns = [
     path('', include(v1_router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
+
+if settings.ASYNC_VIEWS:
+    # Async read views go first, writes to the same URLs are passed
+    # to the router's viewsets.
+    urlpatterns = [
+        path(
+            'ingredients/',
+            async_views.IngredientListView.as_view(),
+            name='ingredient-list',
+        ),
+        path(
+            'ingredients/<int:pk>/',
+            async_views.IngredientDetailView.as_view(),
+            name='ingredient-detail',
+        ),
+        path('tags/', async_views.TagListView.as_view(), name='tag-list'),
+        path(
+            'tags/<int:pk>/',
+            async_views.TagDetailView.as_view(),
+            name='tag-detail',
+        ),
+        path(
+            'recipes/',
+            async_views.RecipeListView.as_view(
+                sync_view=RecipeViewSet.as_view({'post': 'create'})
+            ),
+            name='recipe-list',
+        ),
+        path(
+            'recipes/<int:pk>/',
+            async_views.RecipeDetailView.as_view(
+                sync_view=RecipeViewSet.as_view(
+                    {
+                        'put': 'update',
+                        'patch': 'partial_update',
+                        'delete': 'destroy',
+                    }
+                )
+            ),
+            name='recipe-detail',
+        ),
+        path(
+            'users/subscriptions/',
+            async_views.SubscriptionListView.as_view(),
+            name='user-subscriptions',
+        ),
+    ] + urlpatterns
@@ -1,17 +1,32 @@
+from itertools import chain
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.transaction import atomic
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from api.v1.filters import IngredientFilter, RecipeFilter
-from api.v1.mixins import WriteMethodsMixinView
+from api.v1.mixins import WriteMethodsMixinView, conditional_catalog
+from api.v1.pagination import FeedPagination, KeysetPagination
 from api.v1.permissions import IsOwnerOrReadOnly
+from api.v1.renderers import (
+    PrometheusRenderer,
+    ShoppingCartCSVRenderer,
+    ShoppingCartJSONRenderer,
+    ShoppingCartTextRenderer,
+)
 from api.v1.serializers import (
+    BulkFavoriteSerializer,
+    BulkShoppingCartSerializer,
     IngredientSerializer,
     ReadRecipeSerializer,
     SaveFavoriteSerializer,
@@ -21,7 +36,16 @@ from api.v1.serializers import (
     TagSerializer,
     WriteRecipeSerializer,
 )
-from recipes.models import Ingredient, IngredientQuantity, Recipe, Tag
+from core import constants
+from core.metrics import registry, render_prometheus
+from recipes.models import (
+    FeedEntry,
+    Ingredient,
+    Recipe,
+    ShoppingListItem,
+    Tag,
+)
+from recipes.search import ingredient_index
 
 User = get_user_model()
 
@@ -40,7 +64,9 @@ class UserModelViewSet(WriteMethodsMixinView, UserViewSet):
         permission_classes=[permissions.IsAuthenticated],
     )
     def subscriptions_user(self, request):
-        queryset = request.user.following.all()
+        queryset = SubscriptionSerializer.prepare_queryset(
+            request.user.following.all(), request
+        )
         serializer = SubscriptionSerializer(
             self.paginate_queryset(queryset),
             many=True,
@@ -56,22 +82,29 @@ class UserModelViewSet(WriteMethodsMixinView, UserViewSet):
         permission_classes=[permissions.IsAuthenticated],
     )
     def sub_user(self, request, user_id):
-        get_object_or_404(User, id=user_id)
         return self.add_obj(
-            SaveSubscriptionSerializer(
-                data={'from_user': request.user.id, 'to_user': user_id},
-                context={'request': request},
-            )
+            SaveSubscriptionSerializer(data={}, context={'request': request}),
+            from_user=request.user,
+            to_user=get_object_or_404(User, id=user_id),
         )
 
     @sub_user.mapping.delete
     def unsub_user(self, request, user_id):
-        get_object_or_404(User, id=user_id)
+        def on_remove():
+            User.objects.filter(id=user_id).update(
+                followers_count=Greatest(F('followers_count') - 1, 0)
+            )
+            FeedEntry.objects.unfollow(request.user.id, user_id)
+
         return self.remove_obj(
-            request.user.following, user_id, 'Пользователь в подписках'
+            request.user.following,
+            user_id,
+            'Пользователь в подписках',
+            on_remove=on_remove,
         )
 
 
+@conditional_catalog(constants.INGREDIENTS_VERSION_KEY)
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -80,7 +113,20 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        if settings.INGREDIENT_SEARCH_INDEX:
+            return Response(ingredient_index.search(name))
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer(
+            queryset[: constants.ING_SEARCH_LIMIT], many=True
+        )
+        return Response(serializer.data)
+
 
+@conditional_catalog(constants.TAGS_VERSION_KEY)
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
@@ -90,9 +136,16 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
 class RecipeViewSet(WriteMethodsMixinView, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = [IsOwnerOrReadOnly]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in permissions.SAFE_METHODS:
+            return queryset.with_user_flags(self.request.user)
+        return queryset
+
     def get_serializer_class(self):
         if self.request.method in permissions.SAFE_METHODS:
             return ReadRecipeSerializer
@@ -101,6 +154,16 @@ class RecipeViewSet(WriteMethodsMixinView, viewsets.ModelViewSet):
     def update(self, request, *args, **kwargs):
         return super().update(request, partial=False)
 
+    @atomic
+    def perform_destroy(self, instance):
+        ShoppingListItem.objects.remove_recipe(
+            instance.shopping_cart.values_list('id', flat=True), instance.id
+        )
+        instance.delete()
+        User.objects.filter(id=instance.author_id).update(
+            recipes_count=Greatest(F('recipes_count') - 1, 0)
+        )
+
     @action(
         detail=False,
         methods=['post'],
@@ -111,14 +174,39 @@ class RecipeViewSet(WriteMethodsMixinView, viewsets.ModelViewSet):
     def add_favorite_recipe(self, request, recipe_id):
         return self.add_obj(
             SaveFavoriteSerializer(
-                data={'user': request.user.id, 'recipe': recipe_id}
+                data={'recipe': recipe_id}, context={'request': request}
             )
         )
 
     @add_favorite_recipe.mapping.delete
     def rm_favorite_recipe(self, request, recipe_id):
         return self.remove_obj(
-            request.user.favorites, recipe_id, 'Избранный рецепт'
+            request.user.favorites,
+            recipe_id,
+            'Избранный рецепт',
+            on_remove=lambda: Recipe.objects.filter(id=recipe_id).update(
+                favorites_count=Greatest(F('favorites_count') - 1, 0)
+            ),
+        )
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='favorite',
+        url_name='favorite_bulk',
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def add_favorite_recipes(self, request):
+        return self.bulk_change(
+            BulkFavoriteSerializer(data=request.data), request.user
+        )
+
+    @add_favorite_recipes.mapping.delete
+    def rm_favorite_recipes(self, request):
+        return self.bulk_change(
+            BulkFavoriteSerializer(data=request.data),
+            request.user,
+            remove=True,
         )
 
     @action(
@@ -131,15 +219,61 @@ class RecipeViewSet(WriteMethodsMixinView, viewsets.ModelViewSet):
     def add_shopping_cart(self, request, recipe_id):
         return self.add_obj(
             SaveShoppingCartSerializer(
-                data={'user': request.user.id, 'recipe': recipe_id}
+                data={'recipe': recipe_id}, context={'request': request}
             )
         )
 
     @add_shopping_cart.mapping.delete
     def rm_shopping_cart(self, request, recipe_id):
         return self.remove_obj(
-            request.user.shopping_cart, recipe_id, 'Рецепт в корзине покупок'
+            request.user.shopping_cart,
+            recipe_id,
+            'Рецепт в корзине покупок',
+            on_remove=lambda: ShoppingListItem.objects.remove_recipe(
+                [request.user.id], recipe_id
+            ),
+        )
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='shopping_cart',
+        url_name='shopping_cart_bulk',
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def add_shopping_cart_recipes(self, request):
+        return self.bulk_change(
+            BulkShoppingCartSerializer(data=request.data), request.user
+        )
+
+    @add_shopping_cart_recipes.mapping.delete
+    def rm_shopping_cart_recipes(self, request):
+        return self.bulk_change(
+            BulkShoppingCartSerializer(data=request.data),
+            request.user,
+            remove=True,
+        )
+
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path='feed',
+        url_name='feed',
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def feed(self, request):
+        """Recipes of followed authors, newest first, by cursor."""
+
+        paginator = FeedPagination()
+        recipe_ids = paginator.paginate_sources(
+            FeedEntry.objects.sources(request.user), request
+        )
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        page = paginator.get_keyset_page(
+            [recipes[pk] for pk in recipe_ids if pk in recipes]
         )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(
         detail=False,
@@ -147,37 +281,42 @@ class RecipeViewSet(WriteMethodsMixinView, viewsets.ModelViewSet):
         url_path='download_shopping_cart',
         url_name='download_shopping_cart',
         permission_classes=[permissions.IsAuthenticated],
+        renderer_classes=[
+            ShoppingCartTextRenderer,
+            ShoppingCartCSVRenderer,
+            ShoppingCartJSONRenderer,
+        ],
     )
     def download_shopping_cart(self, request):
-        user = request.user
+        ingredients = iter(
+            ShoppingListItem.objects.filter(user=request.user)
+            .values(
+                'ingredient__name', 'ingredient__measurement_unit', 'amount'
+            )
+            .order_by('ingredient__name')
+            .iterator()
+        )
 
-        if not user.shopping_cart.exists():
+        first = next(ingredients, None)
+        if first is None:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        key_names = {
-            'ingredient__name': 'Ингредиент',
-            'ingredient__measurement_unit': 'Мера измерения',
-            'amount': 'Количество',
-        }
-
-        ingredients = (
-            IngredientQuantity.objects.filter(
-                recipe__shopping_cart__id=user.id
-            )
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(amount=Sum('amount'))
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(chain([first], ingredients)),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
         )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{renderer.format}"'
+        )
+        return response
 
-        response = HttpResponse(content_type='text/plain')
-        response[
-            'Content-Disposition'
-        ] = 'attachment; filename="shopping_cart.txt"'
 
-        response.write('Список покупок:\n')
+class MetricsView(APIView):
+    """Request metrics of all workers in Prometheus text format."""
 
-        for ing in ingredients:
-            for key, val in ing.items():
-                response.write(f'{key_names[key]}: {val}; ')
-            response.write('\n')
+    permission_classes = [permissions.IsAdminUser]
+    renderer_classes = [PrometheusRenderer]
 
-        return response
+    def get(self, request):
+        return Response(render_prometheus(registry.collect()))
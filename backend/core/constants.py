@@ -1,12 +1,14 @@
 EMAIL_MAX_LEN = 254
-PASSWORD_MAX_LEN = (
-    USERNAME_MAX_LEN
-) = FIRST_NAME_MAX_LEN = LAST_NAME_MAX_LEN = 150
+PASSWORD_MAX_LEN = USERNAME_MAX_LEN = FIRST_NAME_MAX_LEN = (
+    LAST_NAME_MAX_LEN
+) = 150
 
 
-RECIPE_NAME_MAX_LEN = (
-    TAG_NAME_MAX_LEN
-) = TAG_SLUG_MAX_LEN = ING_NAME_MAX_LEN = ING_MES_MAX_LEN = 200
+RECIPE_NAME_MAX_LEN = TAG_NAME_MAX_LEN = TAG_SLUG_MAX_LEN = (
+    ING_NAME_MAX_LEN
+) = ING_MES_MAX_LEN = 200
+# casefold() turns one character into at most three.
+ING_NAME_LOWER_MAX_LEN = ING_NAME_MAX_LEN * 3
 TAG_COLOR_MAX_LEN = 7
 RECIPE_CKN_TIME_MIN = ING_AMOUNT_MIN = 1
 RECIPE_CKN_TIME_MAX = ING_AMOUNT_MAX = 32_000
@@ -23,3 +25,53 @@ ING_AMOUNT_MIN_ERR_MSG = (
 ING_AMOUNT_MAX_ERR_MSG = (
     f'Количество ингредиента в рецепте не может быть > {ING_AMOUNT_MAX}.'
 )
+
+ING_SEARCH_LIMIT = 50
+
+INGREDIENTS_VERSION_KEY = 'ingredients_version'
+TAGS_VERSION_KEY = 'tags_version'
+RECIPE_INGREDIENTS_VERSION_KEY = 'recipe_ingredients_version'
+USER_AUTH_VERSION_KEY = 'user_auth_version:{}'
+
+BULK_BATCH_SIZE = 1000
+BULK_RECIPES_MAX_LEN = 100
+
+RECIPE_INDEX_SYNC_OVERLAP = 60
+RECIPE_IDS_IN_MAX_LEN = 500
+
+RECIPES_CACHE = 'recipes'
+RECIPE_DATA_CACHE_KEY = 'recipe_data:{}'
+RECIPE_DATA_CACHE_TIMEOUT = 60 * 60 * 24
+TAG_MAP_CACHE_KEY = 'tag_map'
+
+IMAGE_RENDITIONS_DIR = 'renditions'
+IMAGE_RENDITIONS = {
+    'card': ((480, 480), 'JPEG', 80),
+    'card_webp': ((480, 480), 'WEBP', 80),
+    'detail': ((1200, 1200), 'JPEG', 85),
+    'detail_webp': ((1200, 1200), 'WEBP', 85),
+}
+
+RECIPE_SEARCH_CONFIG = 'russian'
+RECIPE_SEARCH_COLUMN = 'search_vector'
+RECIPE_FTS_TABLE = 'recipes_recipe_fts'
+
+METRICS_PREFIX = 'foodgram_'
+METRICS_FLUSH_INTERVAL = 5
+METRICS_ARCHIVE_FILE = 'archived.json'
+METRICS_LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+FEED_BACKFILL_SIZE = 50
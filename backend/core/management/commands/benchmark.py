@@ -0,0 +1,343 @@
+import base64
+import io
+import json
+import time
+from math import ceil
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+
+def percentile(values, percent):
+    """Return nearest-rank percentile of values."""
+
+    values = sorted(values)
+    return values[max(0, ceil(percent / 100 * len(values)) - 1)]
+
+
+def image_data():
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), 'green').save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+class Command(BaseCommand):
+    """Command to benchmark api/v1 endpoints through the test client.
+
+    Every iteration requests each endpoint once, write endpoints undo
+    their changes, and a new user goes through sign up, token login,
+    password change and logout. Reports p50 and p95 latency and number
+    of queries, and can save results as a baseline or fail on regressions
+    against one.
+    """
+
+    help = 'Benchmark API endpoints on current data'
+
+    def handle(self, *args, **options):
+        try:
+            self.user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(
+                f'User {options["username"]} does not exist,'
+                ' run generate_data first.'
+            )
+        self.prepare()
+        self.results = {}
+        for iteration in range(options['warmup'] + options['iterations']):
+            self.record = iteration >= options['warmup']
+            self.run_iteration()
+
+        report = {
+            name: {
+                'p50': percentile(runs['seconds'], 50) * 1000,
+                'p95': percentile(runs['seconds'], 95) * 1000,
+                'queries': max(runs['queries']),
+            }
+            for name, runs in self.results.items()
+        }
+        self.print_report(report)
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+            self.stdout.write(f'Baseline saved to {options["save_baseline"]}')
+        if options['baseline']:
+            self.compare(report, options['baseline'], options['tolerance'])
+
+    def prepare(self):
+        user = self.user
+        token, _ = Token.objects.get_or_create(user=user)
+        host = next(
+            (
+                host.lstrip('.')
+                for host in settings.ALLOWED_HOSTS
+                if host != '*'
+            ),
+            'localhost',
+        )
+        self.host = host
+        self.client = APIClient(HTTP_HOST=host)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.anonymous = APIClient(HTTP_HOST=host)
+        self.admin = APIClient(HTTP_HOST=host)
+        self.admin.force_authenticate(
+            User(username='bench_admin', is_staff=True)
+        )
+
+        recipe = (
+            Recipe.objects.exclude(author=user)
+            .exclude(favorites=user)
+            .exclude(shopping_cart=user)
+            .order_by('-favorites_count')
+            .first()
+        )
+        author = (
+            User.objects.exclude(id=user.id)
+            .exclude(id__in=user.following.values('id'))
+            .order_by('-followers_count')
+            .first()
+        )
+        if recipe is None or author is None:
+            raise CommandError('Not enough data to benchmark.')
+        ingredients = list(
+            Ingredient.objects.filter(
+                id__in=recipe.ingredientquantity_set.values('ingredient_id')
+            ).values_list('id', 'name')
+        )
+        tags = list(Tag.objects.values_list('id', 'slug')[:2])
+        ing_ids = ','.join(str(ing_id) for ing_id, _ in ingredients)
+        self.recipe_id = recipe.id
+        self.bulk_recipe_ids = list(
+            Recipe.objects.exclude(favorites=user)
+            .exclude(shopping_cart=user)
+            .values_list('id', flat=True)[:10]
+        )
+        self.author_id = author.id
+        self.read_requests = [
+            ('recipe-list', '/api/recipes/'),
+            ('recipe-list cursor', '/api/recipes/?cursor='),
+            (
+                'recipe-list tags',
+                '/api/recipes/?'
+                + '&'.join(f'tags={slug}' for _, slug in tags),
+            ),
+            ('recipe-list is_favorited', '/api/recipes/?is_favorited=1'),
+            (
+                'recipe-list search',
+                f'/api/recipes/?search={recipe.name.split()[0]}',
+            ),
+            (
+                'recipe-list ingredients',
+                f'/api/recipes/?ingredients_include={ing_ids}'
+                '&ingredients_missing=2',
+            ),
+            ('recipe-detail', f'/api/recipes/{recipe.id}/'),
+            ('recipe-feed', '/api/recipes/feed/'),
+            (
+                'recipe-download_shopping_cart',
+                '/api/recipes/download_shopping_cart/',
+            ),
+            (
+                'ingredient-list',
+                f'/api/ingredients/?name={ingredients[0][1][:3]}',
+            ),
+            ('ingredient-detail', f'/api/ingredients/{ingredients[0][0]}/'),
+            ('tag-list', '/api/tags/'),
+            ('tag-detail', f'/api/tags/{tags[0][0]}/'),
+            ('user-list', '/api/users/'),
+            ('user-detail', f'/api/users/{author.id}/'),
+            ('user-me', '/api/users/me/'),
+            ('user-subscriptions', '/api/users/subscriptions/'),
+        ]
+        self.recipe_data = {
+            'ingredients': [
+                {'id': ing_id, 'amount': 10} for ing_id, _ in ingredients
+            ],
+            'tags': [tags[0][0]],
+            'image': image_data(),
+            'name': 'Тестовый рецепт',
+            'text': 'Описание тестового рецепта',
+            'cooking_time': 30,
+        }
+
+    def measure(self, name, method, url, data=None, client=None):
+        client = client or self.client
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            seconds = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{name}: {method.upper()} {url} returned'
+                f' {response.status_code}.'
+            )
+        if self.record:
+            runs = self.results.setdefault(
+                name, {'seconds': [], 'queries': []}
+            )
+            runs['seconds'].append(seconds)
+            runs['queries'].append(len(queries))
+        return response
+
+    def run_iteration(self):
+        for name, url in self.read_requests:
+            self.measure(name, 'get', url)
+        self.measure(
+            'recipe-list anonymous',
+            'get',
+            '/api/recipes/',
+            client=self.anonymous,
+        )
+        self.measure('metrics', 'get', '/api/metrics/', client=self.admin)
+        for name, url in [
+            ('recipe-favorite', f'/api/recipes/{self.recipe_id}/favorite/'),
+            (
+                'recipe-shopping_cart',
+                f'/api/recipes/{self.recipe_id}/shopping_cart/',
+            ),
+            ('user-subscribe', f'/api/users/{self.author_id}/subscribe/'),
+        ]:
+            self.measure(f'{name} POST', 'post', url)
+            self.measure(f'{name} DELETE', 'delete', url)
+        for name, url in [
+            ('recipe-favorite_bulk', '/api/recipes/favorite/'),
+            ('recipe-shopping_cart_bulk', '/api/recipes/shopping_cart/'),
+        ]:
+            data = {'recipes': self.bulk_recipe_ids}
+            self.measure(f'{name} POST', 'post', url, data)
+            self.measure(f'{name} DELETE', 'delete', url, data)
+        response = self.measure(
+            'recipe-list POST', 'post', '/api/recipes/', self.recipe_data
+        )
+        url = f'/api/recipes/{response.data["id"]}/'
+        self.measure('recipe-detail PATCH', 'patch', url, self.recipe_data)
+        self.measure('recipe-detail DELETE', 'delete', url)
+        self.run_auth_requests()
+
+    def run_auth_requests(self):
+        """Sign up a new user, log in and out, then delete the user."""
+
+        name = f'bench_{uuid4().hex[:12]}'
+        password, new_password = uuid4().hex, uuid4().hex
+        self.measure(
+            'user-list POST',
+            'post',
+            '/api/users/',
+            {
+                'email': f'{name}@example.com',
+                'username': name,
+                'first_name': 'Имя',
+                'last_name': 'Фамилия',
+                'password': password,
+            },
+            client=self.anonymous,
+        )
+        try:
+            response = self.measure(
+                'token-login POST',
+                'post',
+                '/api/auth/token/login/',
+                {'email': f'{name}@example.com', 'password': password},
+                client=self.anonymous,
+            )
+            client = APIClient(HTTP_HOST=self.host)
+            client.credentials(
+                HTTP_AUTHORIZATION=f'Token {response.data["auth_token"]}'
+            )
+            self.measure(
+                'user-set_password POST',
+                'post',
+                '/api/users/set_password/',
+                {'current_password': password, 'new_password': new_password},
+                client=client,
+            )
+            self.measure(
+                'token-logout POST',
+                'post',
+                '/api/auth/token/logout/',
+                client=client,
+            )
+        finally:
+            User.objects.filter(username=name).delete()
+
+    def print_report(self, report):
+        width = max(len(name) for name in report)
+        self.stdout.write(
+            f'{"Endpoint":<{width}}  {"p50, ms":>9}  {"p95, ms":>9}  queries'
+        )
+        for name, result in report.items():
+            self.stdout.write(
+                f'{name:<{width}}  {result["p50"]:>9.2f}'
+                f'  {result["p95"]:>9.2f}  {result["queries"]:>7}'
+            )
+
+    def compare(self, report, path, tolerance):
+        with open(path) as file:
+            baseline = json.load(file)
+        regressions = []
+        for name, result in report.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                regressions.append(
+                    f'{name}: {result["queries"]} queries,'
+                    f' baseline {base["queries"]}'
+                )
+            if result['p95'] > base['p95'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: p95 {result["p95"]:.2f} ms,'
+                    f' baseline {base["p95"]:.2f} ms'
+                )
+        if regressions:
+            raise CommandError(
+                'Regressions against baseline:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write('No regressions against baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--username',
+            default='bench_0',
+            help='User to send authenticated requests as',
+        )
+        parser.add_argument(
+            '-n',
+            '--iterations',
+            type=int,
+            default=20,
+            help='Number of measured requests per endpoint',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=2,
+            help='Number of not measured iterations',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Fail, if results are worse than in this baseline file',
+        )
+        parser.add_argument(
+            '--save-baseline', help='Save results as baseline to this file'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Allowed relative p95 latency growth against baseline',
+        )
@@ -0,0 +1,297 @@
+import io
+import random
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from core import constants
+from core.management.commands.load_ingredients import iter_batches
+from core.versions import bump_version
+from recipes import fulltext
+from recipes.models import (
+    FavoriteRecipes,
+    FeedEntry,
+    Ingredient,
+    IngredientQuantity,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from users.models import FollowRelationship
+
+User = get_user_model()
+
+
+def zipf_weights(count, skew):
+    """Return cumulative weights, where item of rank r weighs 1 / r**skew."""
+
+    return list(accumulate(1 / rank**skew for rank in range(1, count + 1)))
+
+
+def power_law_count(rng, mean, limit, alpha=1.5):
+    """Return Pareto distributed count with given mean, at most limit."""
+
+    return min(
+        limit, int(mean * rng.paretovariate(alpha) * (alpha - 1) / alpha)
+    )
+
+
+def recipe_name(ingredient_name, number):
+    suffix = f' №{number}'
+    max_len = constants.RECIPE_NAME_MAX_LEN - len(suffix)
+    return ingredient_name[:max_len].capitalize() + suffix
+
+
+def weighted_sample(rng, population, cum_weights, count):
+    """Return up to count distinct items, popular items more likely."""
+
+    if not count:
+        return set()
+    return set(rng.choices(population, cum_weights=cum_weights, k=count * 2))
+
+
+class Command(BaseCommand):
+    """Command to generate synthetic users, recipes and relations.
+
+    Data is reproducible for the same seed and options. Favorites,
+    carts, follows and recipes per author follow power-law distributions,
+    so some recipes and authors are much more popular than others.
+    """
+
+    help = 'Generate synthetic data for benchmarks'
+
+    def handle(self, *args, **options):
+        if User.objects.filter(
+            username__startswith=options['prefix']
+        ).exists():
+            raise CommandError(
+                f'Users with prefix {options["prefix"]} already exist.'
+            )
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', stdout=self.stdout)
+        self.rng = random.Random(options['seed'])
+        self.options = options
+
+        with transaction.atomic():
+            users = self.create_users()
+            tags = self.create_tags()
+            recipes = self.create_recipes(users, tags)
+            self.create_relations(users, recipes)
+            ShoppingListItem.objects.rebuild()
+            call_command('recount_counters', stdout=self.stdout)
+            FeedEntry.objects.rebuild()
+            for recipe_ids in iter_batches(recipes, constants.BULK_BATCH_SIZE):
+                fulltext.index_recipes(
+                    Recipe.objects.filter(id__in=recipe_ids).only(
+                        'name', 'text'
+                    )
+                )
+
+        for key in [
+            constants.TAGS_VERSION_KEY,
+            constants.RECIPE_INGREDIENTS_VERSION_KEY,
+        ]:
+            bump_version(key)
+        self.stdout.write(
+            f'Generated {len(users)} users, {len(recipes)} recipes.'
+        )
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        password = make_password(self.options['password'])
+        users = User.objects.bulk_create(
+            [
+                User(
+                    username=f'{prefix}{i}',
+                    email=f'{prefix}{i}@example.com',
+                    first_name=f'Имя{i}',
+                    last_name=f'Фамилия{i}',
+                    password=password,
+                )
+                for i in range(self.options['users'])
+            ],
+            batch_size=constants.BULK_BATCH_SIZE,
+        )
+        return [user.id for user in users]
+
+    def create_tags(self):
+        prefix = self.options['prefix']
+        Tag.objects.bulk_create(
+            [
+                Tag(
+                    name=f'{prefix}tag{i}',
+                    slug=f'{prefix}tag{i}',
+                    color='#{:06X}'.format(self.rng.randrange(0x1000000)),
+                )
+                for i in range(self.options['tags'])
+            ],
+            ignore_conflicts=True,
+        )
+        return list(
+            Tag.objects.filter(slug__startswith=f'{prefix}tag').values_list(
+                'id', flat=True
+            )
+        )
+
+    def save_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), 'orange').save(buffer, 'JPEG')
+        return default_storage.save(
+            'api/imgs/benchmark.jpg', ContentFile(buffer.getvalue())
+        )
+
+    def create_recipes(self, users, tags):
+        rng = self.rng
+        image = self.save_image()
+        ingredients = list(Ingredient.objects.values_list('id', 'name'))
+        author_weights = zipf_weights(len(users), self.options['skew'])
+        tag_weights = zipf_weights(len(tags), self.options['skew'])
+        recipe_ids = []
+        for start in range(
+            0, self.options['recipes'], constants.BULK_BATCH_SIZE
+        ):
+            count = min(
+                constants.BULK_BATCH_SIZE, self.options['recipes'] - start
+            )
+            contents = [
+                rng.sample(ingredients, rng.randint(3, 12))
+                for _ in range(count)
+            ]
+            recipes = Recipe.objects.bulk_create(
+                [
+                    Recipe(
+                        author_id=rng.choices(
+                            users, cum_weights=author_weights
+                        )[0],
+                        name=recipe_name(content[0][1], start + i),
+                        text=', '.join(name for _, name in content),
+                        cooking_time=rng.randint(5, 240),
+                        image=image,
+                    )
+                    for i, content in enumerate(contents)
+                ]
+            )
+            IngredientQuantity.objects.bulk_create(
+                [
+                    IngredientQuantity(
+                        recipe_id=recipe.id,
+                        ingredient_id=ing_id,
+                        amount=rng.randint(1, 500),
+                    )
+                    for recipe, content in zip(recipes, contents)
+                    for ing_id, _ in content
+                ]
+            )
+            Recipe.tags.through.objects.bulk_create(
+                [
+                    Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+                    for recipe in recipes
+                    for tag_id in weighted_sample(
+                        rng, tags, tag_weights, rng.randint(1, 3)
+                    )
+                ]
+            )
+            recipe_ids.extend(recipe.id for recipe in recipes)
+        return recipe_ids
+
+    def create_relations(self, users, recipes):
+        rng = self.rng
+        popular_recipes = rng.sample(recipes, len(recipes))
+        recipe_weights = zipf_weights(len(recipes), self.options['skew'])
+        popular_users = rng.sample(users, len(users))
+        user_weights = zipf_weights(len(users), self.options['skew'])
+        relations = [
+            (
+                FavoriteRecipes,
+                'user_id',
+                'recipe_id',
+                popular_recipes,
+                recipe_weights,
+                self.options['favorites'],
+            ),
+            (
+                ShoppingCart,
+                'user_id',
+                'recipe_id',
+                popular_recipes,
+                recipe_weights,
+                self.options['carts'],
+            ),
+            (
+                FollowRelationship,
+                'from_user_id',
+                'to_user_id',
+                popular_users,
+                user_weights,
+                self.options['follows'],
+            ),
+        ]
+        for model, owner, field, population, weights, mean in relations:
+            rows = []
+            for user_id in users:
+                count = power_law_count(rng, mean, len(population))
+                targets = weighted_sample(rng, population, weights, count)
+                targets.discard(user_id)
+                rows.extend(
+                    model(**{owner: user_id, field: target_id})
+                    for target_id in list(targets)[:count]
+                )
+            model.objects.bulk_create(
+                rows,
+                batch_size=constants.BULK_BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=100, help='Number of users'
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=1000, help='Number of recipes'
+        )
+        parser.add_argument(
+            '--tags', type=int, default=10, help='Number of tags'
+        )
+        parser.add_argument(
+            '--favorites',
+            type=int,
+            default=20,
+            help='Mean number of favorite recipes per user',
+        )
+        parser.add_argument(
+            '--carts',
+            type=int,
+            default=3,
+            help='Mean number of recipes in shopping cart per user',
+        )
+        parser.add_argument(
+            '--follows',
+            type=int,
+            default=5,
+            help='Mean number of followed authors per user',
+        )
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.1,
+            help='Zipf exponent of recipe, author and tag popularity',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix',
+            default='bench_',
+            help='Prefix of generated usernames and tag slugs',
+        )
+        parser.add_argument(
+            '--password',
+            default='bench-password',
+            help='Password of generated users',
+        )
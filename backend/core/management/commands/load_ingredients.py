@@ -1,37 +1,158 @@
+import csv
 import json
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from core import constants
+from core.versions import bump_version
 from recipes.models import Ingredient
 
 
+def iter_json_array(file, chunk_size=64 * 1024):
+    """Yield objects of JSON array from file without loading it whole."""
+
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('JSON array expected.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().removeprefix(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise ValueError('Unexpected end of JSON array.')
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def iter_batches(rows, batch_size):
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        yield batch
+
+
 class Command(BaseCommand):
-    """Command to load data from json files to DB."""
+    """Command to load data from json or csv files to DB.
+
+    Rows are read incrementally and inserted in batches inside
+    one transaction, rows already present in DB are skipped.
+    """
 
     FILENAMES_OF_MODELS = [
-        ('ingredients.json', Ingredient),
+        ('ingredients', Ingredient, ['name', 'measurement_unit']),
     ]
 
-    help = 'Load data from .json to DB'
+    help = 'Load data from .json or .csv to DB'
+
+    def read_rows(self, file, file_format, fields):
+        if file_format == 'csv':
+            return csv.DictReader(file, fieldnames=fields)
+        return iter_json_array(file)
 
     def handle(self, *args, **options):
-        print(f'Use path: {options["path"]}')
+        self.stdout.write(f'Use path: {options["path"]}')
 
-        for filename, model in self.FILENAMES_OF_MODELS:
-            print(f'Load file {filename}')
-            with open(f'{options["path"]}/{filename}') as f:
-                reader = json.load(f)
-                for row in reader:
-                    model(**row).save()
+        for name, model, fields in self.FILENAMES_OF_MODELS:
+            filename = f'{name}.{options["format"]}'
+            self.stdout.write(f'Load file {filename}')
+            try:
+                with open(
+                    f'{options["path"]}/{filename}', encoding='utf-8'
+                ) as file, transaction.atomic():
+                    self.load(
+                        model,
+                        fields,
+                        self.read_rows(file, options['format'], fields),
+                        options['batch_size'],
+                        options['dry_run'],
+                    )
+            except (OSError, KeyError, ValueError) as error:
+                raise CommandError(f'Cannot load {filename}: {error}')
 
+        if not options['dry_run']:
+            bump_version(constants.INGREDIENTS_VERSION_KEY)
         return 'OK'
 
+    def load(self, model, fields, rows, batch_size, dry_run):
+        processed = new = 0
+        for batch in iter_batches(rows, batch_size):
+            objs = [
+                model(**{field: row[field] for field in fields})
+                for row in batch
+            ]
+            if dry_run:
+                new_objs = self.get_new_objs(model, fields, objs)
+                for obj in new_objs:
+                    self.stdout.write(
+                        '+ ' + ', '.join(getattr(obj, f) for f in fields)
+                    )
+                new += len(new_objs)
+            else:
+                model.objects.bulk_create(objs, ignore_conflicts=True)
+            processed += len(batch)
+            self.stdout.write(f'Processed {processed} rows')
+
+        if dry_run:
+            self.stdout.write(
+                f'Dry run: {new} rows would be added,'
+                f' {processed - new} already exist.'
+            )
+
+    @staticmethod
+    def get_new_objs(model, fields, objs):
+        """Return objects, which are not present in DB yet."""
+
+        existing = set(
+            model.objects.filter(
+                **{
+                    f'{fields[0]}__in': {
+                        getattr(obj, fields[0]) for obj in objs
+                    }
+                }
+            ).values_list(*fields)
+        )
+        new_objs = []
+        for obj in objs:
+            key = tuple(getattr(obj, field) for field in fields)
+            if key not in existing:
+                existing.add(key)
+                new_objs.append(obj)
+        return new_objs
+
     def add_arguments(self, parser):
         parser.add_argument(
             '-p',
             '--path',
             action='store',
             default=str(settings.BASE_DIR) + '/core/data',
-            help='Path to .json files',
+            help='Path to data files',
+        )
+        parser.add_argument(
+            '-f',
+            '--format',
+            choices=['json', 'csv'],
+            default='json',
+            help='Format of data files',
+        )
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            type=int,
+            default=constants.BULK_BATCH_SIZE,
+            help='Number of rows inserted by one query',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only show rows, which would be added',
         )
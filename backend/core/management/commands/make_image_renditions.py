@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import process_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Command to make image renditions for recipes, which have none."""
+
+    help = 'Make resized copies of recipe images'
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if not options['all']:
+            recipes = recipes.filter(image_renditions={})
+        count = 0
+        for recipe_id, image_name in recipes.values_list('id', 'image'):
+            process_image(recipe_id, image_name, force=options['all'])
+            count += 1
+        self.stdout.write(f'Images scheduled for processing: {count}')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Remake renditions for every recipe',
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import FeedEntry
+
+
+class Command(BaseCommand):
+    """Command to rebuild timelines of subscription feeds.
+
+    Needed after follows or recipes are inserted without signals, or
+    when an author drops below the fan-out followers limit, because
+    recipes published above the limit are not in timelines.
+    """
+
+    help = 'Rebuild subscription feed timelines from follows'
+
+    def handle(self, *args, **options):
+        FeedEntry.objects.rebuild()
+        self.stdout.write(
+            f'Feed timelines rebuilt: {FeedEntry.objects.count()} entries.'
+        )
@@ -0,0 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.transaction import atomic
+
+from recipes.models import FavoriteRecipes, Recipe
+from users.models import FollowRelationship
+
+User = get_user_model()
+
+
+def count_of(model, field):
+    """Return subquery expression counting rows of model per outer pk."""
+
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    """Command to reconcile denormalized counters with source tables."""
+
+    help = 'Recount recipes, followers and favorites counters'
+
+    @atomic
+    def handle(self, *args, **options):
+        counters = [
+            (User, 'recipes_count', count_of(Recipe, 'author')),
+            (
+                User,
+                'followers_count',
+                count_of(FollowRelationship, 'to_user'),
+            ),
+            (Recipe, 'favorites_count', count_of(FavoriteRecipes, 'recipe')),
+        ]
+        for model, field, expected in counters:
+            drifted = model.objects.alias(expected=expected).filter(
+                ~Q(**{field: expected})
+            )
+            if options['verify']:
+                fixed = drifted.count()
+            else:
+                fixed = drifted.update(**{field: expected})
+            self.stdout.write(
+                f'{model.__name__}.{field}: {fixed} rows out of sync.'
+            )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report counters out of sync without fixing them',
+        )
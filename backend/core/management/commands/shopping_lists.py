@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    """Command to rebuild or verify materialized shopping lists."""
+
+    help = 'Rebuild shopping lists totals from shopping carts'
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            ShoppingListItem.objects.rebuild()
+            self.stdout.write('Shopping lists rebuilt.')
+            return
+
+        expected = ShoppingListItem.objects.calculate()
+        stored = ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        )
+        actual = {
+            (user_id, ing_id): amount for user_id, ing_id, amount in stored
+        }
+        mismatches = [
+            (key, actual.get(key), expected.get(key))
+            for key in expected.keys() | actual.keys()
+            if actual.get(key) != expected.get(key)
+        ]
+        for (user_id, ing_id), stored, calculated in sorted(
+            mismatches, key=lambda item: item[0]
+        ):
+            self.stdout.write(
+                f'User {user_id}, ingredient {ing_id}:'
+                f' stored {stored}, expected {calculated}'
+            )
+        self.stdout.write(f'Mismatches found: {len(mismatches)}')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only compare stored totals with shopping carts',
+        )
@@ -0,0 +1,274 @@
+"""Per-route request metrics, aggregated across worker processes.
+
+Every process keeps its own totals and dumps them to a file of its own
+in METRICS_DIR at most once per METRICS_FLUSH_INTERVAL seconds. Metrics
+endpoint sums files of all workers and renders Prometheus text format.
+
+Gunicorn master clears the directory on start and folds files of exited
+workers into archived totals (see gunicorn.conf.py), so totals survive
+worker restarts and files of dead processes are not summed forever.
+"""
+
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+from django.conf import settings
+
+from core import constants
+
+current_record = ContextVar('current_record', default=None)
+
+
+class RequestRecord:
+    """SQL and serializer totals of a single request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+
+    def execute(self, execute, sql, params, many, context):
+        """Database execute wrapper, which counts queries and SQL time."""
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_seconds += time.perf_counter() - start
+
+
+def execute_in_record(execute, sql, params, many, context):
+    """Database execute wrapper of every connection, which counts queries
+    in record of current request.
+
+    Installed on connection itself, so queries run by async views
+    in other threads are counted as well.
+    """
+
+    record = current_record.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    return record.execute(execute, sql, params, many, context)
+
+
+def install_execute_wrapper(connection, **kwargs):
+    """connection_created receiver."""
+
+    if execute_in_record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_in_record)
+
+
+@contextmanager
+def timed_serialization():
+    """Add time spent in the block, except SQL time, to serializer time
+    of current request. Nested blocks are counted once.
+    """
+
+    record = current_record.get()
+    if record is None or record.serializer_depth:
+        yield
+        return
+    record.serializer_depth += 1
+    start = time.perf_counter()
+    sql_seconds = record.sql_seconds
+    try:
+        yield
+    finally:
+        record.serializer_depth -= 1
+        record.serializer_seconds += (
+            time.perf_counter() - start - (record.sql_seconds - sql_seconds)
+        )
+
+
+def empty_totals():
+    return {
+        'buckets': [0] * len(constants.METRICS_LATENCY_BUCKETS),
+        'count': 0,
+        'seconds': 0.0,
+        'queries': 0,
+        'sql_seconds': 0.0,
+        'serializer_seconds': 0.0,
+        'statuses': {},
+    }
+
+
+def merge_totals(totals, other):
+    for i, count in enumerate(other['buckets']):
+        totals['buckets'][i] += count
+    for name in [
+        'count',
+        'seconds',
+        'queries',
+        'sql_seconds',
+        'serializer_seconds',
+    ]:
+        totals[name] += other[name]
+    for code, count in other['statuses'].items():
+        totals['statuses'][code] = totals['statuses'].get(code, 0) + count
+
+
+def process_path(pid):
+    return os.path.join(settings.METRICS_DIR, f'{pid}.json')
+
+
+def read_routes(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_atomically(path, data):
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+def reset_metrics_dir():
+    """Remove totals of previous runs. Called by master on start."""
+
+    shutil.rmtree(settings.METRICS_DIR, ignore_errors=True)
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+
+
+def archive_process(pid):
+    """Fold totals of exited process into archived totals and remove
+    its file. Called by master only, so archive has a single writer.
+    """
+
+    path = process_path(pid)
+    routes = read_routes(path)
+    if routes:
+        archive_path = os.path.join(
+            settings.METRICS_DIR, constants.METRICS_ARCHIVE_FILE
+        )
+        archived = read_routes(archive_path)
+        for key, totals in routes.items():
+            merge_totals(archived.setdefault(key, empty_totals()), totals)
+        write_atomically(archive_path, json.dumps(archived))
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class MetricsRegistry:
+    """Totals of this process by (route, method)."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._routes = {}
+        self._flushed_at = 0
+
+    def observe(self, route, method, status, seconds, record):
+        with self._lock:
+            totals = self._routes.setdefault(
+                f'{route} {method}', empty_totals()
+            )
+            for i, bound in enumerate(constants.METRICS_LATENCY_BUCKETS):
+                if seconds <= bound:
+                    totals['buckets'][i] += 1
+            totals['count'] += 1
+            totals['seconds'] += seconds
+            totals['queries'] += record.queries
+            totals['sql_seconds'] += record.sql_seconds
+            totals['serializer_seconds'] += record.serializer_seconds
+            status = str(status)
+            totals['statuses'][status] = totals['statuses'].get(status, 0) + 1
+        if time.monotonic() - self._flushed_at > (
+            constants.METRICS_FLUSH_INTERVAL
+        ):
+            self.flush()
+
+    def flush(self):
+        """Write totals of this process to its file atomically."""
+
+        with self._lock:
+            data = json.dumps(self._routes)
+            self._flushed_at = time.monotonic()
+        write_atomically(process_path(os.getpid()), data)
+
+    def collect(self):
+        """Return totals of all worker processes by (route, method)."""
+
+        self.flush()
+        collected = {}
+        for name in os.listdir(settings.METRICS_DIR):
+            if not name.endswith('.json'):
+                continue
+            routes = read_routes(os.path.join(settings.METRICS_DIR, name))
+            for key, totals in routes.items():
+                merge_totals(collected.setdefault(key, empty_totals()), totals)
+        return {
+            tuple(key.split(' ', 1)): totals
+            for key, totals in collected.items()
+        }
+
+
+registry = MetricsRegistry()
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(collected):
+    """Render collected totals in Prometheus text exposition format."""
+
+    prefix = constants.METRICS_PREFIX
+    metrics = {
+        'request_duration_seconds': (
+            'histogram',
+            'Request latency.',
+        ),
+        'responses_total': ('counter', 'Responses by status code.'),
+        'sql_queries_total': ('counter', 'SQL queries run by requests.'),
+        'sql_duration_seconds_total': (
+            'counter',
+            'Time spent in SQL queries.',
+        ),
+        'serializer_duration_seconds_total': (
+            'counter',
+            'Time spent in serializers, except SQL.',
+        ),
+    }
+    samples = {name: [] for name in metrics}
+    for (route, method), totals in sorted(collected.items()):
+        labels = f'route="{escape(route)}",method="{escape(method)}"'
+        histogram = samples['request_duration_seconds']
+        for bound, count in zip(
+            constants.METRICS_LATENCY_BUCKETS, totals['buckets']
+        ):
+            histogram.append(f'_bucket{{{labels},le="{bound}"}} {count}')
+        histogram.append(f'_bucket{{{labels},le="+Inf"}} {totals["count"]}')
+        histogram.append(f'_sum{{{labels}}} {totals["seconds"]}')
+        histogram.append(f'_count{{{labels}}} {totals["count"]}')
+        for code, count in sorted(totals['statuses'].items()):
+            samples['responses_total'].append(
+                f'{{{labels},status="{code}"}} {count}'
+            )
+        samples['sql_queries_total'].append(
+            f'{{{labels}}} {totals["queries"]}'
+        )
+        samples['sql_duration_seconds_total'].append(
+            f'{{{labels}}} {totals["sql_seconds"]}'
+        )
+        samples['serializer_duration_seconds_total'].append(
+            f'{{{labels}}} {totals["serializer_seconds"]}'
+        )
+    lines = []
+    for name, (metric_type, help_text) in metrics.items():
+        lines.append(f'# HELP {prefix}{name} {help_text}')
+        lines.append(f'# TYPE {prefix}{name} {metric_type}')
+        lines.extend(f'{prefix}{name}{sample}' for sample in samples[name])
+    return '\n'.join(lines) + '\n'
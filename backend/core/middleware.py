@@ -0,0 +1,71 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from core.metrics import RequestRecord, current_record, registry
+
+
+class MetricsMiddleware:
+    """Records latency, SQL queries and time of requests by route name.
+
+    Works in both sync and async chains. Streaming responses are observed
+    when their content is consumed.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        record = RequestRecord()
+        token = current_record.set(record)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_record.reset(token)
+        return self.observe(request, response, record, start)
+
+    async def __acall__(self, request):
+        record = RequestRecord()
+        token = current_record.set(record)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_record.reset(token)
+        return self.observe(request, response, record, start)
+
+    def observe(self, request, response, record, start):
+        def observe():
+            match = request.resolver_match
+            registry.observe(
+                match.url_name if match and match.url_name else 'unmatched',
+                request.method,
+                response.status_code,
+                time.perf_counter() - start,
+                record,
+            )
+
+        if response.streaming and not response.is_async:
+            response.streaming_content = self.stream(
+                response.streaming_content, record, observe
+            )
+        else:
+            observe()
+        return response
+
+    @staticmethod
+    def stream(content, record, observe):
+        token = current_record.set(record)
+        try:
+            yield from content
+        finally:
+            current_record.reset(token)
+            observe()
@@ -0,0 +1,66 @@
+import hashlib
+import os
+import posixpath
+from uuid import uuid4
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Storage keeping one file per content digest.
+
+    File is saved as <dir>/<ab>/<cd>/<digest><ext>, where digest is sha256
+    of file content. Saving the same content again doesn't write anything,
+    existing file under digest name is treated as saved.
+    """
+
+    chunk_size = 64 * 1024
+
+    def get_digest(self, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(self.chunk_size):
+            digest.update(chunk)
+        content.seek(0)
+        return digest.hexdigest()
+
+    def save(self, name, content, max_length=None):
+        digest = self.get_digest(content)
+        dirname, filename = posixpath.split(name)
+        ext = posixpath.splitext(filename)[1].lower()
+        name = posixpath.join(dirname, digest[:2], digest[2:4], digest + ext)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        """Return digest name unchanged, file under it has same content."""
+
+        return name
+
+    def _save(self, name, content):
+        """Write content to a temporary file and link it to digest name,
+        so the file appears complete or not at all.
+        """
+
+        full_path = self.path(name)
+        os.makedirs(
+            os.path.dirname(full_path),
+            self.directory_permissions_mode or 0o777,
+            exist_ok=True,
+        )
+        tmp_path = f'{full_path}.{uuid4().hex}.tmp'
+        tmp_file = open(os.open(tmp_path, self.OS_OPEN_FLAGS, 0o666), 'wb')
+        try:
+            with tmp_file:
+                for chunk in content.chunks(self.chunk_size):
+                    tmp_file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            os.link(tmp_path, full_path)
+        except FileExistsError:
+            return name
+        finally:
+            os.remove(tmp_path)
+        self._ensure_location_group_id(full_path)
+        return name
@@ -0,0 +1,88 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, override_settings
+
+from core import constants
+from core.metrics import (
+    MetricsRegistry,
+    RequestRecord,
+    archive_process,
+    reset_metrics_dir,
+)
+from core.storage import ContentAddressedStorage
+
+
+class TemporaryMetricsDirMixin:
+    """Points METRICS_DIR to a temporary directory of the test case."""
+
+    @classmethod
+    def setUpClass(cls):
+        metrics_dir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(metrics_dir.cleanup)
+        cls.enterClassContext(override_settings(METRICS_DIR=metrics_dir.name))
+        super().setUpClass()
+
+
+class ContentAddressedStorageTest(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        self.storage = ContentAddressedStorage(location=location.name)
+
+    def test_same_content_is_saved_once(self):
+        name = self.storage.save('images/a.PNG', ContentFile(b'image'))
+        self.assertTrue(name.startswith('images/'))
+        self.assertTrue(name.endswith('.png'))
+        self.assertEqual(
+            self.storage.save('images/b.png', ContentFile(b'image')), name
+        )
+        self.assertEqual(
+            os.listdir(os.path.dirname(self.storage.path(name))),
+            [os.path.basename(name)],
+        )
+        with self.storage.open(name) as file:
+            self.assertEqual(file.read(), b'image')
+
+    def test_existing_file_is_saved(self):
+        """Concurrent save of the same content keeps the first file."""
+
+        name = self.storage.save('images/a.png', ContentFile(b'image'))
+        self.assertEqual(self.storage.get_available_name(name), name)
+        self.assertEqual(self.storage._save(name, ContentFile(b'image')), name)
+        self.assertEqual(
+            os.listdir(os.path.dirname(self.storage.path(name))),
+            [os.path.basename(name)],
+        )
+
+
+class MetricsRegistryTest(TemporaryMetricsDirMixin, SimpleTestCase):
+    def observe(self, registry, count):
+        for _ in range(count):
+            registry.observe('tags-list', 'GET', 200, 0.01, RequestRecord())
+
+    def test_exited_processes_are_archived(self):
+        exited = MetricsRegistry()
+        self.observe(exited, 2)
+        exited.flush()
+        os.rename(
+            os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json'),
+            os.path.join(settings.METRICS_DIR, '1.json'),
+        )
+        archive_process(1)
+        archive_process(1)
+        self.assertEqual(
+            sorted(os.listdir(settings.METRICS_DIR)),
+            [constants.METRICS_ARCHIVE_FILE],
+        )
+        registry = MetricsRegistry()
+        self.observe(registry, 1)
+        totals = registry.collect()[('tags-list', 'GET')]
+        self.assertEqual(totals['count'], 3)
+        self.assertEqual(totals['statuses'], {'200': 3})
+
+        reset_metrics_dir()
+        self.assertEqual(os.listdir(settings.METRICS_DIR), [])
+        self.assertEqual(MetricsRegistry().collect(), {})
@@ -0,0 +1,27 @@
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    """Return version stamp stored in cache, shared between workers."""
+
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """Change version stamp so every worker drops data built on it.
+
+    Version is a timestamp in nanoseconds, so it also tells when data changed.
+    """
+
+    cache.set(key, time.time_ns(), timeout=None)
+
+
+def get_version_datetime(key):
+    return datetime.fromtimestamp(get_version(key) / 10**9, tz=timezone.utc)
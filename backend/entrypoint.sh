@@ -2,4 +2,8 @@ python manage.py migrate --no-input
 python manage.py loaddata fixture.json
 python manage.py load_ingredients
 python manage.py collectstatic --no-input
-gunicorn --bind 0.0.0.0:8000 backend.wsgi
+if [ "$(echo "$ASYNC_VIEWS" | tr A-Z a-z)" = "true" ]; then
+    gunicorn -c gunicorn.conf.py --bind 0.0.0.0:8000 -k uvicorn.workers.UvicornWorker backend.asgi
+else
+    gunicorn -c gunicorn.conf.py --bind 0.0.0.0:8000 backend.wsgi
+fi
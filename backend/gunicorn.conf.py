@@ -0,0 +1,21 @@
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+
+def on_starting(server):
+    from core.metrics import reset_metrics_dir
+
+    reset_metrics_dir()
+
+
+def worker_exit(server, worker):
+    from core.metrics import registry
+
+    registry.flush()
+
+
+def child_exit(server, worker):
+    from core.metrics import archive_process
+
+    archive_process(worker.pid)
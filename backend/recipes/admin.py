@@ -1,4 +1,10 @@
+from collections import Counter, defaultdict
+
 from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest
+from django.db.transaction import atomic
 
 from recipes.models import (
     FavoriteRecipes,
@@ -6,33 +12,177 @@ from recipes.models import (
     IngredientQuantity,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
 
+User = get_user_model()
+
 
 class IngredientQuantityInline(admin.TabularInline):
     model = IngredientQuantity
     extra = 1
 
 
-class IngredientAdmin(admin.ModelAdmin):
+class ShoppingListSyncMixin:
+    """Admin with ingredient quantity inlines, which passes changed
+    amounts to shopping lists of users having the recipes in cart.
+
+    quantities_field is the IngredientQuantity field pointing to
+    the admin's model.
+    """
+
     inlines = [IngredientQuantityInline]
+    quantities_field = None
+
+    def get_amounts(self, obj):
+        """Return amounts of obj's quantities as {(recipe, ingredient):
+        amount}.
+        """
+
+        if obj.pk is None:
+            return {}
+        rows = (
+            IngredientQuantity.objects.filter(**{self.quantities_field: obj})
+            .values_list('recipe_id', 'ingredient_id')
+            .annotate(total=Sum('amount'))
+            .order_by()
+        )
+        return {
+            (recipe_id, ing_id): total for recipe_id, ing_id, total in rows
+        }
+
+    @atomic
+    def save_related(self, request, form, formsets, change):
+        old_amounts = self.get_amounts(form.instance)
+        super().save_related(request, form, formsets, change)
+        new_amounts = self.get_amounts(form.instance)
+        deltas = defaultdict(dict)
+        for recipe_id, ing_id in old_amounts.keys() | new_amounts.keys():
+            deltas[recipe_id][ing_id] = new_amounts.get(
+                (recipe_id, ing_id), 0
+            ) - old_amounts.get((recipe_id, ing_id), 0)
+        for recipe_id, recipe_deltas in deltas.items():
+            ShoppingListItem.objects.apply_deltas(
+                ShoppingCart.objects.filter(recipe_id=recipe_id).values_list(
+                    'user_id', flat=True
+                ),
+                recipe_deltas,
+            )
+
+
+class ShoppingCartAdmin(admin.ModelAdmin):
+    list_display = ['user', 'recipe']
+
+    @atomic
+    def save_model(self, request, obj, form, change):
+        if change:
+            old = ShoppingCart.objects.get(pk=obj.pk)
+            ShoppingListItem.objects.remove_recipe(
+                [old.user_id], old.recipe_id
+            )
+        super().save_model(request, obj, form, change)
+        ShoppingListItem.objects.add_recipe([obj.user_id], obj.recipe_id)
+
+    @atomic
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, ShoppingCart.objects.filter(id=obj.id))
+
+    @atomic
+    def delete_queryset(self, request, queryset):
+        for user_id, recipe_id in queryset.values_list('user_id', 'recipe_id'):
+            ShoppingListItem.objects.remove_recipe([user_id], recipe_id)
+        queryset.delete()
+
+
+class FavoriteRecipesAdmin(admin.ModelAdmin):
+    list_display = ['user', 'recipe']
+
+    @atomic
+    def save_model(self, request, obj, form, change):
+        old_recipe_id = (
+            FavoriteRecipes.objects.filter(pk=obj.pk)
+            .values_list('recipe_id', flat=True)
+            .first()
+            if change
+            else None
+        )
+        super().save_model(request, obj, form, change)
+        if old_recipe_id == obj.recipe_id:
+            return
+        if old_recipe_id is not None:
+            Recipe.objects.filter(id=old_recipe_id).update(
+                favorites_count=Greatest(F('favorites_count') - 1, 0)
+            )
+        Recipe.objects.filter(id=obj.recipe_id).update(
+            favorites_count=F('favorites_count') + 1
+        )
+
+    @atomic
+    def delete_model(self, request, obj):
+        self.delete_queryset(
+            request, FavoriteRecipes.objects.filter(id=obj.id)
+        )
+
+    @atomic
+    def delete_queryset(self, request, queryset):
+        recipes = Counter(queryset.values_list('recipe_id', flat=True))
+        queryset.delete()
+        for recipe_id, count in recipes.items():
+            Recipe.objects.filter(id=recipe_id).update(
+                favorites_count=Greatest(F('favorites_count') - count, 0)
+            )
+
+
+class IngredientAdmin(ShoppingListSyncMixin, admin.ModelAdmin):
+    quantities_field = 'ingredient'
     list_display = ['name', 'measurement_unit']
     search_fields = ['name']
     list_filter = ['name']
     list_display_links = ['name']
 
 
-class RecipeAdmin(admin.ModelAdmin):
-    inlines = [IngredientQuantityInline]
-    list_display = ['name', 'author']
+class RecipeAdmin(ShoppingListSyncMixin, admin.ModelAdmin):
+    quantities_field = 'recipe'
+    list_display = ['name', 'author', 'favorites_count']
     search_fields = ['name', 'author', 'tags']
     list_filter = ['author', 'name', 'tags']
     list_display_links = ['name']
 
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return self.readonly_fields
+        return [*self.readonly_fields, 'author']
+
+    @atomic
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            User.objects.filter(id=obj.author_id).update(
+                recipes_count=F('recipes_count') + 1
+            )
+
+    @atomic
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Recipe.objects.filter(id=obj.id))
+
+    @atomic
+    def delete_queryset(self, request, queryset):
+        authors = Counter()
+        for recipe in queryset:
+            ShoppingListItem.objects.remove_recipe(
+                recipe.shopping_cart.values_list('id', flat=True), recipe.id
+            )
+            authors[recipe.author_id] += 1
+        queryset.delete()
+        for author_id, count in authors.items():
+            User.objects.filter(id=author_id).update(
+                recipes_count=Greatest(F('recipes_count') - count, 0)
+            )
+
 
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Tag)
-admin.site.register(FavoriteRecipes)
-admin.site.register(ShoppingCart)
+admin.site.register(FavoriteRecipes, FavoriteRecipesAdmin)
+admin.site.register(ShoppingCart, ShoppingCartAdmin)
@@ -0,0 +1,147 @@
+"""Full-text search over recipe name and text.
+
+PostgreSQL keeps a generated tsvector column with a GIN index, so it is
+always current. SQLite keeps an FTS5 table, which is updated from
+signals on recipe save and delete.
+"""
+
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from core import constants
+
+WORD_RE = re.compile(r'\w+')
+
+
+def is_postgresql(connection):
+    return connection.vendor == 'postgresql'
+
+
+def normalize(value):
+    """Fold Cyrillic yo, which FTS5 tokenizer keeps distinct from ie."""
+
+    return value.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def fts_query(value):
+    """Convert user input to FTS5 query of quoted prefix terms."""
+
+    words = WORD_RE.findall(normalize(value))
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search(queryset, value):
+    """Filter queryset by full-text query and order it by rank."""
+
+    connection = connections[queryset.db]
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    if is_postgresql(connection):
+        column = f'{table}.{constants.RECIPE_SEARCH_COLUMN}'
+        tsquery = 'websearch_to_tsquery(%s::regconfig, %s)'
+        params = [constants.RECIPE_SEARCH_CONFIG, value]
+        matches = RawSQL(f'{column} @@ {tsquery}', params, BooleanField())
+        rank = RawSQL(f'ts_rank({column}, {tsquery})', params, FloatField())
+    else:
+        query = fts_query(value)
+        if not query:
+            return queryset.none()
+        fts = constants.RECIPE_FTS_TABLE
+        matches = RawSQL(
+            f'{table}.id IN (SELECT rowid FROM {fts} WHERE {fts} MATCH %s)',
+            [query],
+            BooleanField(),
+        )
+        rank = RawSQL(
+            f'(SELECT -bm25({fts}, 4.0, 1.0) FROM {fts}'
+            f' WHERE {fts} MATCH %s AND rowid = {table}.id)',
+            [query],
+            FloatField(),
+        )
+    return (
+        queryset.alias(search_matches=matches)
+        .filter(search_matches=True)
+        .annotate(search_rank=rank)
+        .order_by('-search_rank', '-id')
+    )
+
+
+def index_recipes(recipes, using='default'):
+    """Write recipes name and text to FTS5 table."""
+
+    connection = connections[using]
+    if is_postgresql(connection):
+        return
+    fts = constants.RECIPE_FTS_TABLE
+    rows = [
+        (recipe.id, normalize(recipe.name), normalize(recipe.text))
+        for recipe in recipes
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {fts} WHERE rowid = %s', [row[:1] for row in rows]
+        )
+        cursor.executemany(
+            f'INSERT INTO {fts} (rowid, name, text) VALUES (%s, %s, %s)', rows
+        )
+
+
+def unindex_recipes(recipe_ids, using='default'):
+    """Remove recipes from FTS5 table."""
+
+    connection = connections[using]
+    if is_postgresql(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {constants.RECIPE_FTS_TABLE} WHERE rowid = %s',
+            [(pk,) for pk in recipe_ids],
+        )
+
+
+def create_index(connection):
+    """Create search index and fill it with existing recipes."""
+
+    table = 'recipes_recipe'
+    with connection.cursor() as cursor:
+        if is_postgresql(connection):
+            config = constants.RECIPE_SEARCH_CONFIG
+            column = constants.RECIPE_SEARCH_COLUMN
+            cursor.execute(
+                f'ALTER TABLE {table} ADD COLUMN {column} tsvector'
+                ' GENERATED ALWAYS AS ('
+                f"setweight(to_tsvector('{config}', coalesce(name, '')), 'A')"
+                f" || setweight(to_tsvector('{config}', coalesce(text, '')),"
+                " 'B')) STORED"
+            )
+            cursor.execute(
+                f'CREATE INDEX {table}_{column} ON {table}'
+                f' USING gin ({column})'
+            )
+            return
+        fts = constants.RECIPE_FTS_TABLE
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE {fts} USING fts5'
+            "(name, text, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(f'SELECT id, name, text FROM {table}')
+        rows = [
+            (pk, normalize(name), normalize(text))
+            for pk, name, text in cursor.fetchall()
+        ]
+        cursor.executemany(
+            f'INSERT INTO {fts} (rowid, name, text) VALUES (%s, %s, %s)', rows
+        )
+
+
+def drop_index(connection):
+    with connection.cursor() as cursor:
+        if is_postgresql(connection):
+            cursor.execute(
+                'ALTER TABLE recipes_recipe DROP COLUMN'
+                f' {constants.RECIPE_SEARCH_COLUMN}'
+            )
+        else:
+            cursor.execute(f'DROP TABLE {constants.RECIPE_FTS_TABLE}')
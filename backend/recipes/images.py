@@ -0,0 +1,124 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+
+from core import constants
+from recipes.models import Recipe
+from recipes.signals import drop_recipes_data
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_PROCESSING_WORKERS
+        )
+    return _executor
+
+
+def render_image(src_path, dst_dir, stem, renditions, force=False):
+    """Write resized and recompressed copies of image.
+
+    Runs in worker process, so works with plain paths only.
+    Copies already present are kept unless force is set, since image
+    names are content digests. Returns {rendition: filename}.
+    """
+
+    os.makedirs(dst_dir, exist_ok=True)
+    filenames = {
+        name: f'{stem}_{name}.{image_format.lower()}'
+        for name, (_, image_format, _) in renditions.items()
+    }
+    missing = {
+        name: spec
+        for name, spec in renditions.items()
+        if force or not os.path.exists(os.path.join(dst_dir, filenames[name]))
+    }
+    if not missing:
+        return filenames
+    with Image.open(src_path) as original:
+        original = original.convert('RGB')
+        for name, (size, image_format, quality) in missing.items():
+            image = original.copy()
+            image.thumbnail(size)
+            image.save(
+                os.path.join(dst_dir, filenames[name]),
+                image_format,
+                quality=quality,
+                optimize=True,
+            )
+    return filenames
+
+
+def save_renditions(recipe_id, image_name, filenames):
+    dst_dir = PurePosixPath(image_name).parent / constants.IMAGE_RENDITIONS_DIR
+    renditions = {
+        name: str(dst_dir / filename) for name, filename in filenames.items()
+    }
+    updated = Recipe.objects.filter(id=recipe_id, image=image_name).update(
+        image_renditions=renditions, updated_at=timezone.now()
+    )
+    if updated:
+        drop_recipes_data([recipe_id])
+
+
+def save_rendered(recipe_id, image_name, future):
+    """Save renditions made by worker process.
+
+    Usually runs in executor callback thread, which is not managed by
+    Django, so errors are logged here and the thread's connection is
+    closed. Connection of a transaction is left open, in case the future
+    was done already and the callback runs in the calling thread.
+    """
+
+    try:
+        save_renditions(recipe_id, image_name, future.result())
+    except Exception:
+        logger.exception(
+            'Failed to make renditions of %s for recipe %s',
+            image_name,
+            recipe_id,
+        )
+    finally:
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+def process_image(recipe_id, image_name, force=False):
+    """Make image renditions in process pool, or inline without workers."""
+
+    src_path = default_storage.path(image_name)
+    args = (
+        src_path,
+        os.path.join(
+            os.path.dirname(src_path), constants.IMAGE_RENDITIONS_DIR
+        ),
+        PurePosixPath(image_name).stem,
+        constants.IMAGE_RENDITIONS,
+        force,
+    )
+    if not settings.IMAGE_PROCESSING_WORKERS:
+        save_renditions(recipe_id, image_name, render_image(*args))
+        return
+    future = get_executor().submit(render_image, *args)
+    future.add_done_callback(
+        lambda done: save_rendered(recipe_id, image_name, done)
+    )
+
+
+def schedule_image_processing(recipe):
+    """Process recipe image after current transaction is committed."""
+
+    recipe_id, image_name = recipe.id, recipe.image.name
+    transaction.on_commit(lambda: process_image(recipe_id, image_name))
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:25
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0003_alter_ingredientquantity_amount_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ingredient",
+            index=models.Index(
+                django.db.models.functions.text.Lower("name"),
+                name="recipes_ingredient_name_lower",
+            ),
+        ),
+    ]
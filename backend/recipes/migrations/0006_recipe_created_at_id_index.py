@@ -0,0 +1,19 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0005_shoppinglistitem"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-created_at", "-id"],
+                name="recipes_recipe_created_at_id",
+            ),
+        ),
+    ]
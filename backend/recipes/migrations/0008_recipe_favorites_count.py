@@ -0,0 +1,47 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:36
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, field):
+    return Coalesce(
+        models.Subquery(
+            model.objects.filter(**{field: models.OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=models.Count("pk"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    FollowRelationship = apps.get_model("users", "FollowRelationship")
+    Recipe = apps.get_model("recipes", "Recipe")
+    FavoriteRecipes = apps.get_model("recipes", "FavoriteRecipes")
+    User.objects.update(
+        recipes_count=count_of(Recipe, "author"),
+        followers_count=count_of(FollowRelationship, "to_user"),
+    )
+    Recipe.objects.update(favorites_count=count_of(FavoriteRecipes, "recipe"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0002_user_followers_count_user_recipes_count"),
+        ("recipes", "0007_recipe_image_renditions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="favorites_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="В избранном"
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
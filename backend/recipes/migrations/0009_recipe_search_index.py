@@ -0,0 +1,21 @@
+from django.db import migrations
+
+from recipes import fulltext
+
+
+def create_index(apps, schema_editor):
+    fulltext.create_index(schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    fulltext.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0008_recipe_favorites_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,137 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import RowNumber
+
+from core import constants
+
+
+def fill_timelines(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    FeedEntry = apps.get_model("recipes", "FeedEntry")
+    FollowRelationship = apps.get_model("users", "FollowRelationship")
+    recent = (
+        Recipe.objects.filter(
+            author__followers_count__gt=0,
+            author__followers_count__lte=constants.FEED_FANOUT_MAX_FOLLOWERS,
+        )
+        .annotate(
+            rank=models.Window(
+                RowNumber(),
+                partition_by=[models.F("author")],
+                order_by=[
+                    models.F("created_at").desc(),
+                    models.F("id").desc(),
+                ],
+            )
+        )
+        .filter(rank__lte=constants.FEED_BACKFILL_SIZE)
+        .values_list("id", "author_id", "created_at")
+    )
+    recipes_by_author = {}
+    for recipe in recent:
+        recipes_by_author.setdefault(recipe[1], []).append(recipe)
+    follows = FollowRelationship.objects.filter(
+        to_user_id__in=recipes_by_author
+    ).values_list("from_user_id", "to_user_id")
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                created_at=created_at,
+            )
+            for user_id, followed_id in follows
+            for recipe_id, author_id, created_at in recipes_by_author[
+                followed_id
+            ]
+        ],
+        batch_size=constants.BULK_BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("users", "0002_user_followers_count_user_recipes_count"),
+        ("recipes", "0010_recipe_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeedEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(verbose_name="Дата создания рецепта"),
+                ),
+            ],
+            options={
+                "verbose_name": "Запись ленты",
+                "verbose_name_plural": "Ленты подписок",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["author", "-created_at", "-id"],
+                name="recipes_recipe_author_created",
+            ),
+        ),
+        migrations.AddField(
+            model_name="feedentry",
+            name="author",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name="feedentry",
+            name="recipe",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="recipes.recipe",
+            ),
+        ),
+        migrations.AddField(
+            model_name="feedentry",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="feed",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="feedentry",
+            index=models.Index(
+                fields=["user", "-created_at", "-recipe"],
+                name="recipes_feedentry_user_created",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="feedentry",
+            constraint=models.UniqueConstraint(
+                fields=("user", "recipe"),
+                name="recipes_feedentry_unique_relationships",
+            ),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
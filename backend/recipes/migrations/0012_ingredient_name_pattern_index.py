@@ -0,0 +1,28 @@
+from django.db import migrations
+
+from recipes.fulltext import is_postgresql
+
+INDEX = "recipes_ingredient_name_pattern"
+
+
+def create_index(apps, schema_editor):
+    if is_postgresql(schema_editor.connection):
+        schema_editor.execute(
+            f"CREATE INDEX {INDEX} ON recipes_ingredient"
+            " (lower(name) text_pattern_ops)"
+        )
+
+
+def drop_index(apps, schema_editor):
+    if is_postgresql(schema_editor.connection):
+        schema_editor.execute(f"DROP INDEX {INDEX}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0011_feedentry"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
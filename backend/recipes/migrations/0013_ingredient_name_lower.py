@@ -0,0 +1,62 @@
+from django.db import migrations, models
+
+from recipes.fulltext import is_postgresql
+
+PATTERN_INDEX = "recipes_ingredient_name_pattern"
+
+
+def fill_name_lower(apps, schema_editor):
+    Ingredient = apps.get_model("recipes", "Ingredient")
+    ingredients = list(Ingredient.objects.only("name"))
+    for ingredient in ingredients:
+        ingredient.name_lower = ingredient.name.casefold()
+    Ingredient.objects.bulk_update(
+        ingredients, ["name_lower"], batch_size=1000
+    )
+
+
+def drop_pattern_index(apps, schema_editor):
+    if is_postgresql(schema_editor.connection):
+        schema_editor.execute(f"DROP INDEX {PATTERN_INDEX}")
+
+
+def create_pattern_index(apps, schema_editor):
+    if is_postgresql(schema_editor.connection):
+        schema_editor.execute(
+            f"CREATE INDEX {PATTERN_INDEX} ON recipes_ingredient"
+            " (lower(name) text_pattern_ops)"
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0012_ingredient_name_pattern_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_pattern_index, create_pattern_index),
+        migrations.RemoveIndex(
+            model_name="ingredient",
+            name="recipes_ingredient_name_lower",
+        ),
+        migrations.AddField(
+            model_name="ingredient",
+            name="name_lower",
+            field=models.CharField(
+                default="",
+                editable=False,
+                max_length=600,
+                verbose_name="Название для поиска",
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_name_lower, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="ingredient",
+            index=models.Index(
+                fields=["name_lower"],
+                name="recipes_ingredient_name_lower",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+    ]
@@ -1,9 +1,12 @@
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import RowNumber
 
 from core import constants
+from recipes import fulltext
+from users.models import FollowRelationship
 
 User = get_user_model()
 
@@ -34,16 +37,46 @@ class Tag(models.Model):
         return self.name
 
 
+def normalize(name):
+    """Case fold name, so Cyrillic and Latin prefixes match any case."""
+
+    return name.casefold()
+
+
+class IngredientQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """Fill name_lower, which pre_save signal fills for single saves."""
+
+        objs = list(objs)
+        for obj in objs:
+            obj.set_name_lower()
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class Ingredient(models.Model):
     name = models.CharField('Название', max_length=constants.ING_NAME_MAX_LEN)
+    name_lower = models.CharField(
+        'Название для поиска',
+        max_length=constants.ING_NAME_LOWER_MAX_LEN,
+        editable=False,
+    )
     measurement_unit = models.CharField(
         'Единица измерения', max_length=constants.ING_MES_MAX_LEN
     )
 
+    objects = IngredientQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        indexes = [
+            models.Index(
+                fields=['name_lower'],
+                opclasses=['varchar_pattern_ops'],
+                name='%(app_label)s_%(class)s_name_lower',
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 name='%(app_label)s_%(class)s_unique_relationships',
@@ -54,6 +87,62 @@ class Ingredient(models.Model):
     def __str__(self):
         return self.name
 
+    def set_name_lower(self):
+        self.name_lower = normalize(self.name)
+
+
+class RecipeQuerySet(models.QuerySet):
+    @staticmethod
+    def related_lookups():
+        """Lookups to prefetch for viewer independent recipe data."""
+
+        return [
+            'author',
+            'tags',
+            models.Prefetch(
+                'ingredientquantity_set',
+                queryset=IngredientQuantity.objects.select_related(
+                    'ingredient'
+                ).order_by('ingredient__name'),
+            ),
+        ]
+
+    def with_user_flags(self, user):
+        """Annotate is_favorited, is_in_shopping_cart
+        and is_author_subscribed for given user.
+        """
+
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False),
+                is_author_subscribed=models.Value(False),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                FavoriteRecipes.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+            is_author_subscribed=models.Exists(
+                FollowRelationship.objects.filter(
+                    from_user=user, to_user=models.OuterRef('author')
+                )
+            ),
+        )
+
+    def search(self, value):
+        """Filter recipes by full-text query on name and text,
+        ordered by rank.
+        """
+
+        return fulltext.search(self, value)
+
 
 class Recipe(models.Model):
     author = models.ForeignKey(
@@ -81,6 +170,9 @@ class Recipe(models.Model):
         ],
     )
     image = models.ImageField('Изображение', upload_to='api/imgs/')
+    image_renditions = models.JSONField(
+        'Варианты изображения', default=dict, blank=True, editable=False
+    )
     tags = models.ManyToManyField(
         Tag,
         related_name='recipes',
@@ -104,12 +196,30 @@ class Recipe(models.Model):
         related_name='shopping_cart',
         verbose_name='Корзина покупок',
     )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False
+    )
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    updated_at = models.DateTimeField(
+        'Дата изменения', auto_now=True, db_index=True
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='%(app_label)s_%(class)s_created_at_id',
+            ),
+            models.Index(
+                fields=['author', '-created_at', '-id'],
+                name='%(app_label)s_%(class)s_author_created',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -183,3 +293,298 @@ class IngredientQuantity(models.Model):
             f' {self.amount} {self.ingredient.measurement_unit} ингредиента'
             f' {self.ingredient.__str__()}.'
         )
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    def apply_deltas(self, user_ids, deltas):
+        """Add ingredient amount deltas to shopping lists of given users."""
+
+        user_ids = list(user_ids)
+        deltas = {ing_id: delta for ing_id, delta in deltas.items() if delta}
+        if not user_ids or not deltas:
+            return
+        items = self.filter(user_id__in=user_ids, ingredient_id__in=deltas)
+        existing = set(items.values_list('user_id', 'ingredient_id'))
+        if existing:
+            items.update(
+                amount=models.F('amount')
+                + models.Case(
+                    *[
+                        models.When(ingredient_id=ing_id, then=delta)
+                        for ing_id, delta in deltas.items()
+                    ],
+                    default=0,
+                )
+            )
+        self.bulk_create(
+            [
+                ShoppingListItem(
+                    user_id=user_id, ingredient_id=ing_id, amount=delta
+                )
+                for user_id in user_ids
+                for ing_id, delta in deltas.items()
+                if delta > 0 and (user_id, ing_id) not in existing
+            ]
+        )
+        if existing:
+            items.filter(amount__lte=0).delete()
+
+    def _apply_recipes(self, user_ids, recipe_ids, sign):
+        quantities = (
+            IngredientQuantity.objects.filter(recipe_id__in=recipe_ids)
+            .values_list('ingredient_id')
+            .annotate(total=models.Sum('amount'))
+            .order_by()
+        )
+        self.apply_deltas(
+            user_ids,
+            {ing_id: sign * total for ing_id, total in quantities},
+        )
+
+    def add_recipe(self, user_ids, recipe_id):
+        self._apply_recipes(user_ids, [recipe_id], 1)
+
+    def remove_recipe(self, user_ids, recipe_id):
+        self._apply_recipes(user_ids, [recipe_id], -1)
+
+    def add_recipes(self, user_ids, recipe_ids):
+        self._apply_recipes(user_ids, recipe_ids, 1)
+
+    def remove_recipes(self, user_ids, recipe_ids):
+        self._apply_recipes(user_ids, recipe_ids, -1)
+
+    def calculate(self):
+        """Return totals computed from shopping carts.
+
+        Result is a dict {(user_id, ingredient_id): amount}.
+        """
+
+        totals = (
+            IngredientQuantity.objects.filter(
+                recipe__shopping_cart__isnull=False
+            )
+            .values_list('recipe__shopping_cart', 'ingredient')
+            .annotate(total=models.Sum('amount'))
+            .order_by()
+        )
+        return {(user_id, ing_id): total for user_id, ing_id, total in totals}
+
+    @transaction.atomic
+    def rebuild(self):
+        self.all().delete()
+        self.bulk_create(
+            [
+                ShoppingListItem(
+                    user_id=user_id, ingredient_id=ing_id, amount=amount
+                )
+                for (user_id, ing_id), amount in self.calculate().items()
+            ],
+            batch_size=constants.BULK_BATCH_SIZE,
+        )
+
+
+class ShoppingListItem(models.Model):
+    """Ingredient total in user's shopping list, kept in sync with cart."""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='shopping_list'
+    )
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    amount = models.IntegerField('Количество')
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                name='%(app_label)s_%(class)s_unique_relationships',
+                fields=['user', 'ingredient'],
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f'{self.amount} {self.ingredient.measurement_unit}'
+            f' ингредиента {self.ingredient} у пользователя {self.user}.'
+        )
+
+
+class FeedEntryQuerySet(models.QuerySet):
+    """Timelines of recipes from followed authors.
+
+    Recipes are pushed to timelines of followers on write, unless author
+    has more than FEED_FANOUT_MAX_FOLLOWERS followers. Recipes of such
+    authors are pulled from recipes table on read instead.
+    """
+
+    def entries(self, recipes, user_ids):
+        return [
+            FeedEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                created_at=created_at,
+            )
+            for user_id in user_ids
+            for recipe_id, author_id, created_at in recipes
+        ]
+
+    def sources(self, user):
+        """Return feed sources of user as (queryset, recipe id field)
+        pairs, ordered by created_at like recipes.
+        """
+
+        pulled_ids = list(
+            user.following.filter(
+                followers_count__gt=constants.FEED_FANOUT_MAX_FOLLOWERS
+            ).values_list('id', flat=True)
+        )
+        timeline = self.filter(user=user)
+        if not pulled_ids:
+            return [(timeline, 'recipe_id')]
+        return [
+            (timeline.exclude(author_id__in=pulled_ids), 'recipe_id'),
+            (Recipe.objects.filter(author_id__in=pulled_ids), 'id'),
+        ]
+
+    def fan_out(self, recipe):
+        """Push new recipe to timelines of author's followers."""
+
+        followers = FollowRelationship.objects.filter(
+            to_user_id=recipe.author_id,
+            to_user__followers_count__lte=(
+                constants.FEED_FANOUT_MAX_FOLLOWERS
+            ),
+        ).values_list('from_user_id', flat=True)
+        self.bulk_create(
+            self.entries(
+                [(recipe.id, recipe.author_id, recipe.created_at)], followers
+            ),
+            batch_size=constants.BULK_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def latest(self, author_id, **filters):
+        """Return latest FEED_BACKFILL_SIZE recipes of author as rows
+        for entries().
+        """
+
+        return list(
+            Recipe.objects.filter(author_id=author_id, **filters)
+            .order_by('-created_at', '-id')
+            .values_list('id', 'author_id', 'created_at')[
+                : constants.FEED_BACKFILL_SIZE
+            ]
+        )
+
+    def follow(self, user_id, author_id):
+        """Add latest recipes of followed author to user's timeline."""
+
+        recipes = self.latest(
+            author_id,
+            author__followers_count__lte=constants.FEED_FANOUT_MAX_FOLLOWERS,
+        )
+        self.bulk_create(
+            self.entries(recipes, [user_id]), ignore_conflicts=True
+        )
+
+    def unfollow(self, user_id, author_id):
+        """Drop author's recipes from user's timeline.
+
+        Call after followers_count of author is decremented. Author, who
+        drops back to FEED_FANOUT_MAX_FOLLOWERS followers, switches from
+        pull to fan-out, so recipes added while they were pulled are
+        pushed to timelines of remaining followers.
+        """
+
+        self.filter(user_id=user_id, author_id=author_id).delete()
+        if User.objects.filter(
+            id=author_id, followers_count=constants.FEED_FANOUT_MAX_FOLLOWERS
+        ).exists():
+            followers = FollowRelationship.objects.filter(
+                to_user_id=author_id
+            ).values_list('from_user_id', flat=True)
+            self.bulk_create(
+                self.entries(self.latest(author_id), followers),
+                batch_size=constants.BULK_BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+
+    @transaction.atomic
+    def rebuild(self):
+        """Rebuild timelines with latest FEED_BACKFILL_SIZE recipes
+        of every followed author with fan-out.
+        """
+
+        self.all().delete()
+        recent = (
+            Recipe.objects.filter(
+                author__followers_count__gt=0,
+                author__followers_count__lte=(
+                    constants.FEED_FANOUT_MAX_FOLLOWERS
+                ),
+            )
+            .annotate(
+                rank=models.Window(
+                    RowNumber(),
+                    partition_by=[models.F('author')],
+                    order_by=[
+                        models.F('created_at').desc(),
+                        models.F('id').desc(),
+                    ],
+                )
+            )
+            .filter(rank__lte=constants.FEED_BACKFILL_SIZE)
+            .values_list('id', 'author_id', 'created_at')
+        )
+        recipes_by_author = {}
+        for recipe in recent:
+            recipes_by_author.setdefault(recipe[1], []).append(recipe)
+        follows = FollowRelationship.objects.filter(
+            to_user_id__in=recipes_by_author
+        ).values_list('from_user_id', 'to_user_id')
+        rows = []
+        for user_id, author_id in follows.iterator():
+            rows.extend(self.entries(recipes_by_author[author_id], [user_id]))
+            if len(rows) >= constants.BULK_BATCH_SIZE:
+                self.bulk_create(rows)
+                rows = []
+        self.bulk_create(rows)
+
+
+class FeedEntry(models.Model):
+    """Recipe in timeline of a follower of its author."""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='feed', db_index=False
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='+'
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+'
+    )
+    created_at = models.DateTimeField('Дата создания рецепта')
+
+    objects = FeedEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at', '-recipe'],
+                name='%(app_label)s_%(class)s_user_created',
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                name='%(app_label)s_%(class)s_unique_relationships',
+                fields=['user', 'recipe'],
+            ),
+        ]
+
+    def __str__(self):
+        return f'Рецепт {self.recipe} в ленте пользователя {self.user}.'
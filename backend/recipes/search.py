@@ -0,0 +1,183 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import chain
+from threading import Lock
+
+from django.utils import timezone
+
+from core import constants
+from core.versions import get_version
+from recipes.models import (
+    Ingredient,
+    IngredientQuantity,
+    Recipe,
+    normalize,
+)
+
+
+class IngredientPrefixIndex:
+    """Per-worker sorted index of ingredients for prefix search.
+
+    Index is rebuilt lazily when ingredients version stamp changes.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._keys = []
+        self._rows = []
+
+    def _refresh(self):
+        version = get_version(constants.INGREDIENTS_VERSION_KEY)
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            rows = sorted(
+                Ingredient.objects.values('id', 'name', 'measurement_unit'),
+                key=lambda row: (normalize(row['name']), row['id']),
+            )
+            self._keys = [normalize(row['name']) for row in rows]
+            self._rows = rows
+            self._version = version
+
+    def search(self, prefix, limit=constants.ING_SEARCH_LIMIT):
+        self._refresh()
+        keys, rows = self._keys, self._rows
+        prefix = normalize(prefix)
+        result = []
+        for i in range(bisect_left(keys, prefix), len(keys)):
+            if len(result) >= limit or not keys[i].startswith(prefix):
+                break
+            result.append(rows[i])
+        return result
+
+
+ingredient_index = IngredientPrefixIndex()
+
+
+class RecipeIngredientIndex:
+    """Per-worker inverted index: ingredient id -> sorted array of ids
+    of recipes, which use the ingredient.
+
+    Index is built once and then updated incrementally with recipes
+    changed since the previous sync, when recipe ingredients version stamp
+    changes. Too many changed recipes trigger full rebuild instead.
+    Deleted recipes may stay in the index, callers filter ids against
+    the database anyway.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._synced_at = None
+        self._postings = {}
+        self._sizes = array('H')
+
+    def _load(self, recipe_ids=None):
+        rows = IngredientQuantity.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).order_by('recipe_id')
+        if recipe_ids is not None:
+            rows = rows.filter(recipe_id__in=recipe_ids)
+        return rows.iterator(chunk_size=constants.BULK_BATCH_SIZE)
+
+    def _rebuild(self):
+        postings = defaultdict(lambda: array('I'))
+        self._sizes = array('H')
+        for recipe_id, ing_id in self._load():
+            postings[ing_id].append(recipe_id)
+            self._add_size(recipe_id, 1)
+        self._postings = dict(postings)
+
+    def _add_size(self, recipe_id, count):
+        """Change number of ingredients of recipe, stored by recipe id."""
+
+        sizes = self._sizes
+        if recipe_id >= len(sizes):
+            sizes.frombytes(
+                bytes(sizes.itemsize * (recipe_id + 1 - len(sizes)))
+            )
+        sizes[recipe_id] += count
+
+    def _update(self, recipe_ids):
+        for posting in self._postings.values():
+            for recipe_id in recipe_ids:
+                i = bisect_left(posting, recipe_id)
+                if i < len(posting) and posting[i] == recipe_id:
+                    del posting[i]
+        for recipe_id in recipe_ids:
+            if recipe_id < len(self._sizes):
+                self._sizes[recipe_id] = 0
+        for recipe_id, ing_id in self._load(recipe_ids):
+            insort(self._postings.setdefault(ing_id, array('I')), recipe_id)
+            self._add_size(recipe_id, 1)
+
+    def _refresh(self):
+        version = get_version(constants.RECIPE_INGREDIENTS_VERSION_KEY)
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            started = timezone.now()
+            changed = None
+            if self._synced_at is not None:
+                since = self._synced_at - timedelta(
+                    seconds=constants.RECIPE_INDEX_SYNC_OVERLAP
+                )
+                changed = sorted(
+                    Recipe.objects.filter(updated_at__gte=since).values_list(
+                        'id', flat=True
+                    )[: constants.BULK_BATCH_SIZE + 1]
+                )
+            if changed is None or len(changed) > constants.BULK_BATCH_SIZE:
+                self._rebuild()
+            else:
+                self._update(changed)
+            self._synced_at = started
+            self._version = version
+
+    def _postings_for(self, ing_ids):
+        return [self._postings.get(ing_id, ()) for ing_id in set(ing_ids)]
+
+    def with_all(self, ing_ids):
+        """Return ids of recipes, which use all given ingredients."""
+
+        self._refresh()
+        with self._lock:
+            postings = sorted(self._postings_for(ing_ids), key=len)
+            if not postings:
+                return set()
+            recipe_ids = set(postings[0])
+            for posting in postings[1:]:
+                recipe_ids.intersection_update(posting)
+            return recipe_ids
+
+    def with_any(self, ing_ids):
+        """Return ids of recipes, which use any of given ingredients."""
+
+        self._refresh()
+        with self._lock:
+            return set(chain.from_iterable(self._postings_for(ing_ids)))
+
+    def missing_at_most(self, ing_ids, max_missing):
+        """Return ids of recipes, which use some of given ingredients
+        and need at most max_missing other ingredients.
+        """
+
+        self._refresh()
+        with self._lock:
+            matched = Counter(chain.from_iterable(self._postings_for(ing_ids)))
+            sizes = self._sizes
+            return {
+                recipe_id
+                for recipe_id, count in matched.items()
+                if sizes[recipe_id] - count <= max_missing
+            }
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core import constants
+from core.versions import bump_version
+from recipes import fulltext
+from recipes.models import (
+    FeedEntry,
+    Ingredient,
+    IngredientQuantity,
+    Recipe,
+    Tag,
+)
+
+User = get_user_model()
+
+
+def drop_recipes_data(recipe_ids):
+    """Drop cached recipes data after current transaction is committed."""
+
+    keys = [constants.RECIPE_DATA_CACHE_KEY.format(pk) for pk in recipe_ids]
+    transaction.on_commit(
+        lambda: caches[constants.RECIPES_CACHE].delete_many(keys)
+    )
+
+
+@receiver(pre_save, sender=Ingredient)
+def ingredient_saving(instance, **kwargs):
+    instance.set_name_lower()
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredient_changed(**kwargs):
+    bump_version(constants.INGREDIENTS_VERSION_KEY)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(**kwargs):
+    bump_version(constants.TAGS_VERSION_KEY)
+
+
+def recipe_ingredients_changed():
+    """Let ingredient indexes sync after current transaction is committed."""
+
+    transaction.on_commit(
+        lambda: bump_version(constants.RECIPE_INGREDIENTS_VERSION_KEY)
+    )
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    drop_recipes_data([instance.id])
+    recipe_ingredients_changed()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, using, update_fields=None, **kwargs):
+    if update_fields and not {'name', 'text'} & set(update_fields):
+        return
+    fulltext.index_recipes([instance], using)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        FeedEntry.objects.fan_out(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, using, **kwargs):
+    fulltext.unindex_recipes([instance.id], using)
+
+
+@receiver([post_save, post_delete], sender=IngredientQuantity)
+def ingredient_quantity_changed(instance, **kwargs):
+    drop_recipes_data([instance.recipe_id])
+    recipe_ingredients_changed()
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, created, update_fields=None, **kwargs):
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    drop_recipes_data(instance.recipes.values_list('id', flat=True))
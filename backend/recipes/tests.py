@@ -0,0 +1,315 @@
+from concurrent.futures import Future
+from unittest import mock
+
+from django.contrib.admin.sites import site
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+
+from core.tests import TemporaryMetricsDirMixin
+from recipes.images import save_rendered
+from recipes.models import (
+    FavoriteRecipes,
+    Ingredient,
+    IngredientQuantity,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from recipes.search import RecipeIngredientIndex
+
+User = get_user_model()
+
+
+def create_user(number):
+    return User.objects.create_user(
+        username=f'user{number}',
+        email=f'user{number}@example.com',
+        password='test-password',
+    )
+
+
+def create_recipe(author, amounts):
+    """Create recipe with {ingredient: amount} quantities."""
+
+    recipe = Recipe.objects.create(
+        author=author,
+        name='Рецепт',
+        text='Описание',
+        cooking_time=10,
+        image='api/imgs/test.png',
+    )
+    IngredientQuantity.objects.bulk_create(
+        [
+            IngredientQuantity(recipe=recipe, ingredient=ing, amount=amount)
+            for ing, amount in amounts.items()
+        ]
+    )
+    return recipe
+
+
+@override_settings(IMAGE_PROCESSING_WORKERS=0)
+class ShoppingListTest(TemporaryMetricsDirMixin, TestCase):
+    """Shopping list totals stay equal to totals of shopping carts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [create_user(number) for number in range(3)]
+        cls.salt, cls.sugar, cls.milk = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ['Соль', 'Сахар', 'Молоко']
+        ]
+        cls.soup = create_recipe(cls.users[0], {cls.salt: 5, cls.milk: 200})
+        cls.cake = create_recipe(cls.users[0], {cls.sugar: 100, cls.milk: 50})
+
+    def add_to_cart(self, user, recipe):
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+        ShoppingListItem.objects.add_recipe([user.id], recipe.id)
+
+    def assertTotals(self, expected):
+        items = ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        )
+        stored = {
+            (user_id, ing_id): amount for user_id, ing_id, amount in items
+        }
+        self.assertEqual(stored, ShoppingListItem.objects.calculate())
+        self.assertEqual(stored, expected)
+
+    def test_add_and_remove_recipes(self):
+        user = self.users[1]
+        self.add_to_cart(user, self.soup)
+        self.add_to_cart(user, self.cake)
+        self.assertTotals(
+            {
+                (user.id, self.salt.id): 5,
+                (user.id, self.sugar.id): 100,
+                (user.id, self.milk.id): 250,
+            }
+        )
+        ShoppingCart.objects.filter(user=user, recipe=self.soup).delete()
+        ShoppingListItem.objects.remove_recipe([user.id], self.soup.id)
+        self.assertTotals(
+            {(user.id, self.sugar.id): 100, (user.id, self.milk.id): 50}
+        )
+
+    def test_apply_deltas_creates_updates_and_drops_items(self):
+        first, second = self.users[1:]
+        self.add_to_cart(first, self.soup)
+        self.add_to_cart(second, self.soup)
+        self.add_to_cart(second, self.cake)
+        IngredientQuantity.objects.filter(
+            recipe=self.soup, ingredient=self.milk
+        ).delete()
+        IngredientQuantity.objects.create(
+            recipe=self.soup, ingredient=self.sugar, amount=10
+        )
+        ShoppingListItem.objects.apply_deltas(
+            [first.id, second.id], {self.milk.id: -200, self.sugar.id: 10}
+        )
+        self.assertTotals(
+            {
+                (first.id, self.salt.id): 5,
+                (first.id, self.sugar.id): 10,
+                (second.id, self.salt.id): 5,
+                (second.id, self.sugar.id): 110,
+                (second.id, self.milk.id): 50,
+            }
+        )
+
+    def test_admin_recipe_delete_updates_lists(self):
+        user = self.users[1]
+        self.add_to_cart(user, self.soup)
+        self.add_to_cart(user, self.cake)
+        admin = site._registry[Recipe]
+        request = RequestFactory().post('/')
+        admin.delete_model(request, self.soup)
+        self.assertTotals(
+            {(user.id, self.sugar.id): 100, (user.id, self.milk.id): 50}
+        )
+        admin.delete_queryset(request, Recipe.objects.all())
+        self.assertTotals({})
+
+    def test_admin_quantity_edit_updates_lists(self):
+        first, second = self.users[1:]
+        self.add_to_cart(first, self.soup)
+        self.add_to_cart(second, self.soup)
+        admin_user = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'test-password'
+        )
+        self.client.force_login(admin_user)
+        tag = Tag.objects.create(name='Обед', color='#00FF00', slug='lunch')
+        quantities = list(self.soup.ingredientquantity_set.order_by('id'))
+        prefix = 'ingredientquantity_set'
+        data = {
+            'name': self.soup.name,
+            'text': self.soup.text,
+            'cooking_time': self.soup.cooking_time,
+            'tags': [tag.id],
+            f'{prefix}-TOTAL_FORMS': 3,
+            f'{prefix}-INITIAL_FORMS': 2,
+            f'{prefix}-MIN_NUM_FORMS': 0,
+            f'{prefix}-MAX_NUM_FORMS': 1000,
+            f'{prefix}-2-recipe': self.soup.id,
+            f'{prefix}-2-ingredient': self.sugar.id,
+            f'{prefix}-2-amount': 30,
+        }
+        for i, (quantity, amount) in enumerate(zip(quantities, [5, 150])):
+            data.update(
+                {
+                    f'{prefix}-{i}-id': quantity.id,
+                    f'{prefix}-{i}-recipe': self.soup.id,
+                    f'{prefix}-{i}-ingredient': quantity.ingredient_id,
+                    f'{prefix}-{i}-amount': amount,
+                }
+            )
+        data[f'{prefix}-0-DELETE'] = 'on'
+        response = self.client.post(
+            f'/admin/recipes/recipe/{self.soup.id}/change/', data
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertTotals(
+            {
+                (user.id, ing.id): amount
+                for user in [first, second]
+                for ing, amount in [(self.milk, 150), (self.sugar, 30)]
+            }
+        )
+
+    def test_admin_shopping_cart_changes_update_lists(self):
+        user = self.users[1]
+        admin = site._registry[ShoppingCart]
+        request = RequestFactory().post('/')
+        cart = ShoppingCart(user=user, recipe=self.soup)
+        admin.save_model(request, cart, None, change=False)
+        self.assertTotals(
+            {(user.id, self.salt.id): 5, (user.id, self.milk.id): 200}
+        )
+        cart.recipe = self.cake
+        admin.save_model(request, cart, None, change=True)
+        self.assertTotals(
+            {(user.id, self.sugar.id): 100, (user.id, self.milk.id): 50}
+        )
+        admin.delete_model(request, cart)
+        self.assertTotals({})
+
+
+class RecipeAdminTest(TestCase):
+    """Recipe admin keeps author recipes_count."""
+
+    def test_add_and_delete(self):
+        author = create_user(0)
+        admin = site._registry[Recipe]
+        request = RequestFactory().post('/')
+        recipes = [create_recipe(author, {}) for _ in range(3)]
+        for recipe in recipes:
+            admin.save_model(request, recipe, None, change=False)
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, 3)
+        admin.delete_model(request, recipes[0])
+        admin.delete_queryset(request, Recipe.objects.all())
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, 0)
+
+
+class FavoriteRecipesAdminTest(TestCase):
+    """Favorites admin keeps recipe favorites_count."""
+
+    def test_add_change_and_delete(self):
+        user, author = create_user(0), create_user(1)
+        soup, cake = create_recipe(author, {}), create_recipe(author, {})
+        admin = site._registry[FavoriteRecipes]
+        request = RequestFactory().post('/')
+
+        def assertCounts(soup_count, cake_count):
+            self.assertEqual(
+                list(
+                    Recipe.objects.filter(id__in=[soup.id, cake.id])
+                    .order_by('id')
+                    .values_list('favorites_count', flat=True)
+                ),
+                [soup_count, cake_count],
+            )
+
+        favorite = FavoriteRecipes(user=user, recipe=soup)
+        admin.save_model(request, favorite, None, change=False)
+        assertCounts(1, 0)
+        admin.save_model(request, favorite, None, change=True)
+        assertCounts(1, 0)
+        favorite.recipe = cake
+        admin.save_model(request, favorite, None, change=True)
+        assertCounts(0, 1)
+        admin.save_model(
+            request, FavoriteRecipes(user=author, recipe=cake), None, False
+        )
+        admin.delete_queryset(request, FavoriteRecipes.objects.all())
+        assertCounts(0, 0)
+
+
+class ImageProcessingTest(TestCase):
+    def test_failed_rendering_is_logged(self):
+        future = Future()
+        future.set_exception(OSError('Неверное изображение'))
+        with self.assertLogs('recipes.images', 'ERROR'):
+            save_rendered(1, 'recipes/images/test.png', future)
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'recipes-tests',
+        },
+        'recipes': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'recipes-tests-recipes',
+        },
+    },
+    IMAGE_PROCESSING_WORKERS=0,
+)
+class RecipeIngredientIndexTest(TestCase):
+    """Index synced incrementally gives the same answers as rebuilt one."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user(0)
+        cls.salt, cls.sugar, cls.milk = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ['Соль', 'Сахар', 'Молоко']
+        ]
+        cls.soup = create_recipe(cls.author, {cls.salt: 5, cls.milk: 200})
+        cls.cake = create_recipe(cls.author, {cls.sugar: 100, cls.milk: 50})
+
+    def setUp(self):
+        cache.clear()
+        self.index = RecipeIngredientIndex()
+
+    def assertMatches(self, index, expected):
+        salt, sugar, milk = self.salt.id, self.sugar.id, self.milk.id
+        self.assertEqual(
+            [
+                index.with_all([salt, milk]),
+                index.with_any([sugar]),
+                index.missing_at_most([milk], 1),
+            ],
+            expected,
+        )
+
+    def test_incremental_sync(self):
+        soup, cake = self.soup.id, self.cake.id
+        self.assertMatches(self.index, [{soup}, {cake}, {soup, cake}])
+        with self.captureOnCommitCallbacks(execute=True):
+            pancake = create_recipe(
+                self.author, {self.sugar: 10, self.milk: 100, self.salt: 1}
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientQuantity.objects.filter(
+                recipe=self.soup, ingredient=self.milk
+            ).delete()
+            self.soup.save()
+        expected = [{pancake.id}, {cake, pancake.id}, {cake}]
+        with mock.patch.object(self.index, '_rebuild') as rebuild:
+            self.assertMatches(self.index, expected)
+        rebuild.assert_not_called()
+        self.assertMatches(RecipeIngredientIndex(), expected)
@@ -1,8 +1,30 @@
 from django.contrib import admin
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.transaction import atomic
 
+from recipes.models import FeedEntry
 from users.models import FollowRelationship, User
 
 
+def follow(from_user_id, to_user_id):
+    """Update counter and feed after follow relationship is added."""
+
+    User.objects.filter(id=to_user_id).update(
+        followers_count=F('followers_count') + 1
+    )
+    FeedEntry.objects.follow(from_user_id, to_user_id)
+
+
+def unfollow(from_user_id, to_user_id):
+    """Update counter and feed after follow relationship is deleted."""
+
+    User.objects.filter(id=to_user_id).update(
+        followers_count=Greatest(F('followers_count') - 1, 0)
+    )
+    FeedEntry.objects.unfollow(from_user_id, to_user_id)
+
+
 class FollowToInline(admin.TabularInline):
     model = FollowRelationship
     fk_name = 'from_user'
@@ -13,11 +35,70 @@ class FollowToInline(admin.TabularInline):
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     inlines = [FollowToInline]
-    list_display = ['id', 'username', 'email']
+    list_display = [
+        'id',
+        'username',
+        'email',
+        'recipes_count',
+        'followers_count',
+    ]
     search_fields = ['email', 'username']
     list_filter = ['email', 'username']
     empty_value_display = '-пусто-'
     list_display_links = ['id', 'username', 'email']
 
+    @staticmethod
+    def get_following_ids(user):
+        return set(
+            FollowRelationship.objects.filter(from_user=user).values_list(
+                'to_user_id', flat=True
+            )
+        )
+
+    @atomic
+    def save_related(self, request, form, formsets, change):
+        user = form.instance
+        old_ids = self.get_following_ids(user)
+        super().save_related(request, form, formsets, change)
+        new_ids = self.get_following_ids(user)
+        for to_user_id in old_ids - new_ids:
+            unfollow(user.id, to_user_id)
+        for to_user_id in new_ids - old_ids:
+            follow(user.id, to_user_id)
+
+
+@admin.register(FollowRelationship)
+class FollowRelationshipAdmin(admin.ModelAdmin):
+    list_display = ['from_user', 'to_user']
+
+    @atomic
+    def save_model(self, request, obj, form, change):
+        old = (
+            FollowRelationship.objects.filter(pk=obj.pk)
+            .values_list('from_user_id', 'to_user_id')
+            .first()
+            if change
+            else None
+        )
+        super().save_model(request, obj, form, change)
+        new = (obj.from_user_id, obj.to_user_id)
+        if old == new:
+            return
+        if old is not None:
+            unfollow(*old)
+        follow(*new)
+
+    @atomic
+    def delete_model(self, request, obj):
+        self.delete_queryset(
+            request, FollowRelationship.objects.filter(id=obj.id)
+        )
 
-admin.site.register(FollowRelationship)
+    @atomic
+    def delete_queryset(self, request, queryset):
+        relationships = list(
+            queryset.values_list('from_user_id', 'to_user_id')
+        )
+        queryset.delete()
+        for from_user_id, to_user_id in relationships:
+            unfollow(from_user_id, to_user_id)
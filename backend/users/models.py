@@ -22,6 +22,14 @@ class User(AbstractUser):
         max_length=constants.LAST_NAME_MAX_LEN,
     )
 
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0, editable=False
+    )
+
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0, editable=False
+    )
+
     followers = models.ManyToManyField(
         'self',
         through='FollowRelationship',
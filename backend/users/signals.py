@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from core import constants
+from core.versions import bump_version
+from users.models import User
+
+
+@receiver(post_save, sender=User)
+def user_changed(instance, created, update_fields=None, **kwargs):
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    bump_version(constants.USER_AUTH_VERSION_KEY.format(instance.pk))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(instance, **kwargs):
+    bump_version(constants.USER_AUTH_VERSION_KEY.format(instance.pk))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    bump_version(constants.USER_AUTH_VERSION_KEY.format(instance.user_id))
@@ -0,0 +1,120 @@
+from django.contrib.admin.sites import site
+from django.forms import MultiWidget
+from django.test import RequestFactory, TestCase, override_settings
+
+from core.tests import TemporaryMetricsDirMixin
+from recipes.models import FeedEntry, Recipe
+from users.models import FollowRelationship, User
+
+
+def create_user(number):
+    return User.objects.create_user(
+        username=f'user{number}',
+        email=f'user{number}@example.com',
+        first_name='Имя',
+        last_name='Фамилия',
+        password='test-password',
+    )
+
+
+@override_settings(IMAGE_PROCESSING_WORKERS=0)
+class FollowAdminTest(TemporaryMetricsDirMixin, TestCase):
+    """Follow admins keep followers_count and feed timelines."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        cls.authors = [create_user(number) for number in range(1, 3)]
+        for author in cls.authors:
+            Recipe.objects.create(
+                author=author,
+                name='Рецепт',
+                text='Описание',
+                cooking_time=10,
+                image='api/imgs/test.png',
+            )
+
+    def assertFollowed(self, *followed):
+        self.assertEqual(
+            [
+                (author.followers_count, author.id in followed)
+                for author in User.objects.filter(
+                    id__in=[author.id for author in self.authors]
+                ).order_by('id')
+            ],
+            [
+                (int(author.id in followed), author.id in followed)
+                for author in self.authors
+            ],
+        )
+        self.assertEqual(
+            set(
+                FeedEntry.objects.filter(user=self.user).values_list(
+                    'author_id', flat=True
+                )
+            ),
+            set(followed),
+        )
+
+    def test_user_change_view_inline(self):
+        admin_user = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'test-password'
+        )
+        self.client.force_login(admin_user)
+        url = f'/admin/users/user/{self.user.id}/change/'
+        data, prefix = self.get_form_data(url)
+        data[f'{prefix}-TOTAL_FORMS'] = 1
+        data[f'{prefix}-0-to_user'] = self.authors[0].id
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertFollowed(self.authors[0].id)
+
+        data, prefix = self.get_form_data(url)
+        data[f'{prefix}-0-to_user'] = self.authors[1].id
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertFollowed(self.authors[1].id)
+
+        data, prefix = self.get_form_data(url)
+        data[f'{prefix}-0-DELETE'] = 'on'
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertFollowed()
+
+    def get_form_data(self, url):
+        """Return POST data of the change form with current values,
+        without extra inline forms, and prefix of the follows inline.
+        """
+
+        response = self.client.get(url)
+        (inline,) = response.context['inline_admin_formsets']
+        formset = inline.formset
+        data = {}
+        for form in [
+            response.context['adminform'].form,
+            formset.management_form,
+            *formset.initial_forms,
+        ]:
+            for field in form:
+                value = field.value()
+                if value is None or value is False:
+                    continue
+                widget = field.field.widget
+                if isinstance(widget, MultiWidget):
+                    for i, part in enumerate(widget.decompress(value)):
+                        data[f'{field.html_name}_{i}'] = part
+                else:
+                    data[field.html_name] = value
+        data[f'{formset.prefix}-TOTAL_FORMS'] = len(formset.initial_forms)
+        return data, formset.prefix
+
+    def test_relationship_admin(self):
+        admin = site._registry[FollowRelationship]
+        request = RequestFactory().post('/')
+        relationship = FollowRelationship(
+            from_user=self.user, to_user=self.authors[0]
+        )
+        admin.save_model(request, relationship, None, change=False)
+        self.assertFollowed(self.authors[0].id)
+        relationship.to_user = self.authors[1]
+        admin.save_model(request, relationship, None, change=True)
+        self.assertFollowed(self.authors[1].id)
+        admin.delete_model(request, relationship)
+        self.assertFollowed()